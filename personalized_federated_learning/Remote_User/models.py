@@ -6,36 +6,18 @@ import os
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parent_dir)
 
-try:
-    from firestore_backend import FirestoreManager
-except ImportError:
-    # Fallback for development
-    class FirestoreManager:
-        def __init__(self, collection_name):
-            self.collection_name = collection_name
-        
-        def create(self, **kwargs):
-            return type('MockObject', (), kwargs)()
-        
-        def all(self):
-            return []
-        
-        def filter(self, **kwargs):
-            return self
-        
-        def get(self, **kwargs):
-            raise Exception("Object not found")
-        
-        def values(self, *fields):
-            return []
-        
-        def delete_all(self):
-            pass
+from firestore_backend import FirestoreManager
 
 # Create your models here.
+# FIELDS lists each collection's document fields (besides id); FirestoreManager reads documents into
+# compact rows with exactly these attributes
 
 class ClientRegister_Model:
-    objects = FirestoreManager('client_register')
+    # login looks users up by username + password: see firestore.indexes.json for the composite index
+    FIELDS = ('username', 'email', 'password', 'phoneno', 'country', 'state', 'city', 'gender', 'address')
+    objects = FirestoreManager('client_register', fields=FIELDS)
+    # Fields kept in the session after login so profile pages need no read
+    PROFILE_FIELDS = ('id', 'username', 'email', 'phoneno', 'country', 'state', 'city', 'gender', 'address')
     
     def __init__(self, **kwargs):
         self.id = kwargs.get('id')
@@ -50,7 +32,13 @@ class ClientRegister_Model:
         self.address = kwargs.get('address')
 
 class mortality_prediction:
-    objects = FirestoreManager('mortality_predictions')
+    # Good/Bad totals are kept in sharded counters so the ratio page never scans the collection. Only
+    # writes through objects update them: documents added directly (src/app/dashboard/page.tsx,
+    # scripts/setup.js) are only counted once `manage.py reconcile_counters` runs, e.g. from cron
+    FIELDS = ('Fid', 'PatientId', 'ICU_AppointmentID', 'Gender', 'ScheduledDay', 'AppointmentDay', 'Age',
+              'Scheduled_Doctor', 'Scholarship', 'Hipertension', 'Diabetes', 'Alcoholism', 'Handcap', 'SMS_received',
+              'Patient_Diagnosis', 'Prediction')
+    objects = FirestoreManager('mortality_predictions', counters=('Prediction',), fields=FIELDS)
     
     def __init__(self, **kwargs):
         self.Fid = kwargs.get('Fid')
@@ -71,19 +59,41 @@ class mortality_prediction:
         self.Prediction = kwargs.get('Prediction')
 
 class detection_accuracy:
-    objects = FirestoreManager('detection_accuracy')
+    FIELDS = ('names', 'ratio')
+    objects = FirestoreManager('detection_accuracy', fields=FIELDS)
     
     def __init__(self, **kwargs):
         self.names = kwargs.get('names')
         self.ratio = kwargs.get('ratio')
 
 class detection_ratio:
-    objects = FirestoreManager('detection_ratio')
+    FIELDS = ('names', 'ratio')
+    objects = FirestoreManager('detection_ratio', fields=FIELDS)
     
     def __init__(self, **kwargs):
         self.names = kwargs.get('names')
         self.ratio = kwargs.get('ratio')
 
+class training_job:
+    # Polled while another process updates it, so never served from the query cache
+    FIELDS = ('mode', 'status', 'stage', 'progress', 'error', 'model_version', 'results', 'created_at', 'started_at',
+              'finished_at', 'heartbeat_at')
+    objects = FirestoreManager('training_jobs', cache=False, fields=FIELDS)
+    
+    def __init__(self, **kwargs):
+        self.id = kwargs.get('id')
+        self.mode = kwargs.get('mode')
+        self.status = kwargs.get('status')
+        self.stage = kwargs.get('stage')
+        self.progress = kwargs.get('progress')
+        self.error = kwargs.get('error')
+        self.model_version = kwargs.get('model_version')
+        self.results = kwargs.get('results')
+        self.created_at = kwargs.get('created_at')
+        self.started_at = kwargs.get('started_at')
+        self.finished_at = kwargs.get('finished_at')
+        self.heartbeat_at = kwargs.get('heartbeat_at')
+
 # Keep the original Django models for compatibility (but they won't be used)
 class ClientRegister_Model_Original(models.Model):
     username = models.CharField(max_length=30)
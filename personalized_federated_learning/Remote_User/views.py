@@ -1,15 +1,17 @@
 from django.db.models import Count
 from django.db.models import Q
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import JsonResponse
 
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
-from sklearn.metrics import accuracy_score
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.ensemble import VotingClassifier
+import io
+import json
 # Create your views here.
 from Remote_User.models import ClientRegister_Model,mortality_prediction,detection_ratio,detection_accuracy
+from model_registry import registry
+from prediction_cache import normalize_inputs, prediction_cache, prediction_key
+
+# Patient columns shared by the prediction form, Datasets.csv and batch uploads
+INPUT_FIELDS = [field for field in mortality_prediction.FIELDS if field != 'Prediction']
 
 def login(request):
 
@@ -21,6 +23,7 @@ def login(request):
         try:
             enter = ClientRegister_Model.objects.get(username=username,password=password)
             request.session["userid"] = enter.id
+            request.session["profile"] = _profile(enter)
 
             return redirect('ViewYourProfile')
         except:
@@ -56,132 +59,106 @@ def Register1(request):
     else:
         return render(request,'RUser/Register1.html')
 
+def _profile(user):
+    return {field: getattr(user, field, None) for field in ClientRegister_Model.PROFILE_FIELDS}
+
 def ViewYourProfile(request):
     userid = request.session['userid']
-    obj = ClientRegister_Model.objects.get(id= userid)
+    obj = request.session.get('profile')
+    if not obj or obj.get('id') != userid:
+        # Older sessions have no cached profile: one point read, then keep it
+        obj = _profile(ClientRegister_Model.objects.get_by_id(userid))
+        request.session['profile'] = obj
     return render(request,'RUser/ViewYourProfile.html',{'object':obj})
 
 
 def Predict_Hospital_Morality_Prediction(request):
     if request.method == "POST":
-
-        if request.method == "POST":
-
-            Fid= request.POST.get('Fid')
-            PatientId= request.POST.get('PatientId')
-            ICU_AppointmentID= request.POST.get('ICU_AppointmentID')
-            Gender= request.POST.get('Gender')
-            ScheduledDay= request.POST.get('ScheduledDay')
-            AppointmentDay= request.POST.get('AppointmentDay')
-            Age= request.POST.get('Age')
-            Scheduled_Doctor= request.POST.get('Scheduled_Doctor')
-            Scholarship= request.POST.get('Scholarship')
-            Hipertension= request.POST.get('Hipertension')
-            Diabetes= request.POST.get('Diabetes')
-            Alcoholism= request.POST.get('Alcoholism')
-            Handcap= request.POST.get('Handcap')
-            SMS_received= request.POST.get('SMS_received')
-            Patient_Diagnosis= request.POST.get('Patient_Diagnosis')
-
-        df = pd.read_csv('Datasets.csv')
-
-        def apply_response(Label):
-            if (Label == 0):
-                return 0  # Good
-            elif(Label==1):
-                return 1  # Bad
-
-        df['results'] = df['Label'].apply(apply_response)
-
-
-        X = df['Fid'].apply(str)
-        y = df['results']
-
-        print("Fid")
-        print(X)
-        print("Results")
-        print(y)
-
-        cv = CountVectorizer()
-        X = cv.fit_transform(X)
-
-        models = []
-        from sklearn.model_selection import train_test_split
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.20)
-        X_train.shape, X_test.shape, y_train.shape
-
-
-        # SVM Model
-        print("SVM")
-        from sklearn import svm
-
-        lin_clf = svm.LinearSVC()
-        lin_clf.fit(X_train, y_train)
-        predict_svm = lin_clf.predict(X_test)
-        svm_acc = accuracy_score(y_test, predict_svm) * 100
-        print("ACCURACY")
-        print(svm_acc)
-        print("CLASSIFICATION REPORT")
-        print(classification_report(y_test, predict_svm))
-        print("CONFUSION MATRIX")
-        print(confusion_matrix(y_test, predict_svm))
-        models.append(('svm', lin_clf))
-
-
-        print("SGD Classifier")
-        from sklearn.linear_model import SGDClassifier
-        sgd_clf = SGDClassifier(loss='hinge', penalty='l2', random_state=0)
-        sgd_clf.fit(X_train, y_train)
-        sgdpredict = sgd_clf.predict(X_test)
-        print("ACCURACY")
-        print(accuracy_score(y_test, sgdpredict) * 100)
-        print("CLASSIFICATION REPORT")
-        print(classification_report(y_test, sgdpredict))
-        print("CONFUSION MATRIX")
-        print(confusion_matrix(y_test, sgdpredict))
-        models.append(('SGDClassifier', sgd_clf))
-
-        classifier = VotingClassifier(models)
-        classifier.fit(X_train, y_train)
-        y_pred = classifier.predict(X_test)
-
-        Fid1 = [Fid]
-        vector1 = cv.transform(Fid1).toarray()
-        predict_text = classifier.predict(vector1)
-
-        pred = str(predict_text).replace("[", "")
-        pred1 = pred.replace("]", "")
-
-        prediction = int(pred1)
-
-        if (prediction == 0):
-            val = 'Good'
-        elif (prediction == 1):
-            val = 'Bad'
-
-        print(val)
-        print(pred1)
-
-        mortality_prediction.objects.create(
-        Fid=Fid,
-        PatientId=PatientId,
-        ICU_AppointmentID=ICU_AppointmentID,
-        Gender=Gender,
-        ScheduledDay=ScheduledDay,
-        AppointmentDay=AppointmentDay,
-        Age=Age,
-        Scheduled_Doctor=Scheduled_Doctor,
-        Scholarship=Scholarship,
-        Hipertension=Hipertension,
-        Diabetes=Diabetes,
-        Alcoholism=Alcoholism,
-        Handcap=Handcap,
-        SMS_received=SMS_received,
-        Patient_Diagnosis=Patient_Diagnosis,
-        Prediction=val)
+        values = normalize_inputs(request.POST, INPUT_FIELDS)
+        artifact = _active_model()
+        key = prediction_key(values, INPUT_FIELDS)
+        val = prediction_cache.get(artifact.version, key)
+        if val is None:
+            import pandas as pd
+
+            val = str(artifact.predict(pd.DataFrame([values]))[0])
+            # The id is derived from the model and the inputs, so a resubmission stores no second
+            # record and the Prediction counters count it once
+            mortality_prediction.objects.get_or_create(id='%s-%s' % (artifact.version, key),
+                                                       defaults=dict(values, Prediction=val))
+            prediction_cache.put(artifact.version, key, val)
 
         return render(request, 'RUser/Predict_Hospital_Morality_Prediction.html',{'objs': val})
     return render(request, 'RUser/Predict_Hospital_Morality_Prediction.html')
 
 
 
+
+
+def _active_model():
+    artifact = registry.get()
+    if artifact is None:
+        # Nothing published yet: wait for the one bootstrap training job every request shares.
+        # The training stack is imported here, not at module load, to keep worker startup fast
+        from training_jobs import wait_for_model
+        artifact = wait_for_model()
+    return artifact
+
+
+def _read_batch(request):
+    """Parse an uploaded CSV file, a raw CSV body or a JSON array into a DataFrame of patients"""
+    import pandas as pd
+
+    if 'file' in request.FILES:
+        frame = pd.read_csv(request.FILES['file'], dtype=str, keep_default_na=False)
+    elif request.content_type == 'text/csv':
+        frame = pd.read_csv(io.BytesIO(request.body), dtype=str, keep_default_na=False)
+    else:
+        try:
+            rows = json.loads(request.body or b'null')
+        except ValueError:
+            raise ValueError("Body is neither a CSV upload nor valid JSON")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("Expected a JSON array of patient objects")
+        if not rows:
+            return pd.DataFrame(columns=INPUT_FIELDS, dtype=str)
+        # Objects, not inferred dtypes: keys missing from some rows would become NaN and integers floats
+        frame = pd.DataFrame(rows, dtype=object)
+        frame = frame.where(frame.notna(), '').astype(str)
+
+    if 'Fid' not in frame.columns:
+        raise ValueError("Missing required column: Fid")
+    for field in INPUT_FIELDS:
+        if field not in frame.columns:
+            # Stored like a blank form field
+            frame[field] = ''
+    return frame[INPUT_FIELDS]
+
+
+def Predict_Hospital_Morality_Prediction_Batch(request):
+    """Score many patients at once with one transform and one predict call.
+
+    POST a CSV (multipart ``file`` or ``text/csv`` body) or a JSON array with
+    the Datasets.csv columns. Pass ``?persist=0`` to skip storing the results.
+    Like the other forms this is CSRF protected: scripts send the ``csrftoken``
+    cookie back in an ``X-CSRFToken`` header.
+    """
+    import pandas as pd
+
+    if request.method != "POST":
+        return JsonResponse({'error': 'POST a CSV file or a JSON array of patients'}, status=405)
+    try:
+        frame = _read_batch(request)
+    except (ValueError, pd.errors.ParserError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    artifact = _active_model()
+
+    frame['Prediction'] = artifact.predict(frame) if len(frame) else []
+
+    if request.GET.get('persist', '1') != '0':
+        mortality_prediction.objects.bulk_create(frame.to_dict('records'))
+
+    predictions = frame[['Fid', 'PatientId', 'ICU_AppointmentID', 'Prediction']].to_dict('records')
+    return JsonResponse({'model_version': artifact.version, 'count': len(predictions),
+                         'predictions': predictions})
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from firestore_backend import FirestoreManager
+from firestore_memory import InMemoryFirestore
+from firestore_sqlite import SQLiteFirestore
+
+
+def _sample_rows(count):
+    return [{
+        'Fid': '10.42.0.%d-172.217.10.131-%d-443-6' % (i % 250, 40000 + i % 20000),
+        'PatientId': str(326000 + i),
+        'Prediction': 'Good' if i % 2 else 'Bad',
+    } for i in range(count)]
+
+
+# Read paths the views use, timed one by one in the 'query' mode
+QUERIES = [
+    ('count filtered', lambda manager, doc: manager.filter(Prediction='Good').count()),
+    ('get by field', lambda manager, doc: manager.get(PatientId=doc.PatientId)),
+    ('get by id', lambda manager, doc: manager.get(id=doc.id)),
+    ('ordered top 10', lambda manager, doc: list(manager.all().order_by('-PatientId')[:10])),
+    ('values_list', lambda manager, doc: manager.all().values_list('Prediction', flat=True)),
+]
+
+
+class Command(BaseCommand):
+    help = "Benchmark FirestoreManager write and read paths against the local storage engines"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--docs', type=int, default=2000, help="Documents written per mode")
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help="Simulated round-trip time in seconds (memory engine)")
+        parser.add_argument('--modes', default='create,bulk,buffered',
+                            help="Comma separated subset of create,bulk,buffered,query")
+        parser.add_argument('--engines', default='memory', help="Comma separated subset of memory,sqlite")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs of each read in the query mode")
+
+    def _engine(self, name, directory, options):
+        if name == 'sqlite':
+            return SQLiteFirestore(os.path.join(directory, 'benchmark-%d.sqlite3' % time.monotonic_ns()))
+        return InMemoryFirestore(latency=options['latency'])
+
+    def _queries(self, manager, rows, repeat):
+        manager.bulk_create(rows)
+        doc = manager.all().order_by('id')[:1][0]
+        for name, query in QUERIES:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                query(manager, doc)
+            self.stdout.write("  %-16s %8.2fms per query" % (name, (time.perf_counter() - start) * 1000 / repeat))
+
+    def handle(self, *args, **options):
+        rows = _sample_rows(options['docs'])
+        with tempfile.TemporaryDirectory() as directory:
+            for engine in options['engines'].split(','):
+                for mode in options['modes'].split(','):
+                    db = self._engine(engine, directory, options)
+                    # Uncached, so every read reaches the engine
+                    manager = FirestoreManager('benchmark', db=db, cache=False)
+                    if mode == 'query':
+                        self.stdout.write("%s %s, %d docs:" % (engine, mode, len(rows)))
+                        self._queries(manager, rows, options['repeat'])
+                        db.close()
+                        continue
+                    start = time.perf_counter()
+                    if mode == 'create':
+                        for row in rows:
+                            manager.create(**row)
+                    elif mode == 'bulk':
+                        manager.bulk_create(rows)
+                    elif mode == 'buffered':
+                        with manager.buffered():
+                            for row in rows:
+                                manager.create(**row)
+                    else:
+                        self.stderr.write("Unknown mode: %s" % mode)
+                        continue
+                    elapsed = time.perf_counter() - start
+                    round_trips = db.round_trips
+                    self.stdout.write("%-6s %-9s %6d docs  %5d round-trips  %8.3fs  %10.0f docs/s" % (
+                        engine, mode, manager.count(), round_trips, elapsed,
+                        len(rows) / elapsed if elapsed else float('inf')))
+                    db.close()
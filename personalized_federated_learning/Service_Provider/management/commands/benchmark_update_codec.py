@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from federated import run_federated
+from update_codec import codec_from_spec
+
+
+def _weighted_accuracy(clients, key):
+    scored = [client for client in clients if client[key] is not None]
+    rows = sum(client['test_rows'] for client in scored)
+    return sum(client[key] * client['test_rows'] for client in scored) / rows if rows else 0.0
+
+
+class Command(BaseCommand):
+    help = "Compare federated update codecs: bytes exchanged, round time and accuracy on Datasets.csv"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--codecs', default='raw,float32,int8,top0.1+int8,top0.01+int8',
+                            help="Comma separated codec specs; the first is the baseline")
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--clients', type=int, default=10)
+        parser.add_argument('--local-epochs', type=int, default=1)
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rows = []
+        for spec in options['codecs'].split(','):
+            result = run_federated(rounds=options['rounds'], num_clients=options['clients'],
+                                   local_epochs=options['local_epochs'], workers=options['workers'],
+                                   codec=codec_from_spec(spec))
+            rows.append((
+                result.codec_name,
+                sum(report['bytes_down'] + report['bytes_up'] for report in result.rounds),
+                sum(report['seconds'] for report in result.rounds) / len(result.rounds),
+                _weighted_accuracy(result.clients, 'global_accuracy'),
+                _weighted_accuracy(result.clients, 'personalized_accuracy'),
+            ))
+
+        baseline_bytes, baseline_accuracy = rows[0][1], rows[0][3]
+        self.stdout.write("%-16s %14s %8s %10s %9s %10s %13s" % (
+            "codec", "bytes", "ratio", "s/round", "global", "vs first", "personalized"))
+        for name, total, seconds, global_accuracy, personalized_accuracy in rows:
+            self.stdout.write("%-16s %14d %7.1fx %10.3f %8.1f%% %+9.1f%% %12.1f%%" % (
+                name, total, baseline_bytes / total if total else float('inf'), seconds,
+                global_accuracy * 100, (global_accuracy - baseline_accuracy) * 100, personalized_accuracy * 100))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from federated import run_federated
+from features import PatientFeatures
+from model_registry import registry
+from update_codec import codec_from_spec
+
+
+class Command(BaseCommand):
+    help = "Train the prediction model with FedAvg over per-doctor clients and report each round"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--clients', type=int, default=10,
+                            help="Number of clients; the smallest doctors are merged into one")
+        parser.add_argument('--local-epochs', type=int, default=1)
+        parser.add_argument('--personalize-epochs', type=int, default=2)
+        parser.add_argument('--learning-rate', type=float, default=0.01)
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--codec', default='raw',
+                            help="Update encoding: raw, float32, int8, top<fraction>[+int8] (e.g. top0.01+int8)")
+        parser.add_argument('--publish', action='store_true', help="Publish the global model to the registry")
+
+    def handle(self, *args, **options):
+        result = run_federated(rounds=options['rounds'], num_clients=options['clients'],
+                               local_epochs=options['local_epochs'],
+                               personalize_epochs=options['personalize_epochs'],
+                               learning_rate=options['learning_rate'], workers=options['workers'],
+                               seed=options['seed'], codec=codec_from_spec(options['codec']))
+
+        self.stdout.write("%5s %9s %14s %14s" % ("round", "seconds", "bytes down", "bytes up"))
+        for report in result.rounds:
+            self.stdout.write("%(round)5d %(seconds)9.2f %(bytes_down)14d %(bytes_up)14d" % report)
+        self.stdout.write("total %9.2f %14d %14d" % (
+            sum(report['seconds'] for report in result.rounds),
+            sum(report['bytes_down'] for report in result.rounds),
+            sum(report['bytes_up'] for report in result.rounds)))
+
+        self.stdout.write("\n%-28s %6s %8s %12s" % ("client", "rows", "global", "personalized"))
+        for client in result.clients:
+            self.stdout.write("%-28s %6d %8s %12s" % (
+                client['client'][:28], client['train_rows'] + client['test_rows'],
+                _percent(client['global_accuracy']), _percent(client['personalized_accuracy'])))
+
+        if options['publish']:
+            version = registry.publish(PatientFeatures(), result.classifier(), feature_column=None,
+                                       trained_rows=sum(client['train_rows'] for client in result.clients),
+                                       federated_rounds=result.rounds, update_codec=result.codec_name)
+            self.stdout.write("Published model " + version)
+
+
+def _percent(value):
+    return '-' if value is None else '%.1f%%' % (value * 100)
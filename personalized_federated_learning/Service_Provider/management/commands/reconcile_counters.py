@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from Remote_User import models
+from firestore_backend import FirestoreManager
+
+
+class Command(BaseCommand):
+    help = "Recount the sharded per-value counters, picking up documents written without FirestoreManager"
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        for model in vars(models).values():
+            manager = getattr(model, 'objects', None)
+            if not isinstance(manager, FirestoreManager):
+                continue
+            for field in manager.counters:
+                counts = manager.rebuild_counters(field)
+                self.stdout.write("%s.%s: %s" % (manager.collection_name, field, ', '.join(
+                    '%s=%d' % item for item in sorted(counts.items())) or 'empty'))
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before it can serve its first request
+STARTUP = "import django; django.setup(); import %s"
+
+
+def _import_times(stderr):
+    """(cumulative seconds, self seconds, module) for every line of -X importtime output"""
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = [part.strip() for part in line[len('import time:'):].split('|')]
+        if len(parts) != 3 or not parts[0].isdigit():
+            continue
+        times.append((int(parts[1]) / 1e6, int(parts[0]) / 1e6, parts[2]))
+    return times
+
+
+class Command(BaseCommand):
+    help = "Report which modules dominate the import time of a fresh worker"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default=settings.ROOT_URLCONF,
+                            help="Module imported after django.setup() (default: ROOT_URLCONF)")
+        parser.add_argument('--top', type=int, default=25, help="Number of modules to list")
+
+    def handle(self, *args, **options):
+        # A fresh interpreter, so nothing this process already imported hides the cost
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP % options['module']],
+                                 cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if process.returncode:
+            raise CommandError(process.stderr.strip().splitlines()[-1])
+
+        times = _import_times(process.stderr)
+        self.stdout.write("%-60s %10s %10s" % ("module", "cumulative", "self"))
+        for cumulative, own, name in sorted(times, reverse=True)[:options['top']]:
+            self.stdout.write("%-60s %9.3fs %9.3fs" % (name.strip()[:60], cumulative, own))
+        self.stdout.write("%d modules, %.3fs of imports, %.3fs wall time including interpreter start" % (
+            len(times), sum(own for _, own, _ in times), wall))
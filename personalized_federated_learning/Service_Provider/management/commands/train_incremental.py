@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from incremental import INCREMENTAL_MODELS, update_incremental
+
+
+class Command(BaseCommand):
+    help = "partial_fit the incremental models on rows appended to Datasets.csv since the last run"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=None, help="Dataset to read (default: Datasets.csv)")
+        parser.add_argument('--serve', choices=INCREMENTAL_MODELS, default='sgd',
+                            help="Which incremental model to publish")
+        parser.add_argument('--no-publish', action='store_true')
+
+    def handle(self, *args, **options):
+        report = update_incremental(path=options['csv'], serve=options['serve'],
+                                    publish=not options['no_publish'])
+        self.stdout.write("%s%d new rows, %d in total, %.3fs" % (
+            "Rebuilt from scratch: " if report['rebuilt'] else "", report['new_rows'], report['total_rows'],
+            report['seconds']))
+        if report['accuracy_before_update'] is not None:
+            self.stdout.write("Accuracy on the new rows before the update: %.2f%%" % report['accuracy_before_update'])
+        if report['version']:
+            self.stdout.write("Published model " + report['version'])
@@ -1,32 +1,25 @@
-from django.db.models import  Count, Avg
 from django.shortcuts import render, redirect
-from django.db.models import Count
 import sys
 import os
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parent_dir)
 
-try:
-    from firestore_backend import Q
-except ImportError:
-    # Fallback Q class for development
-    class Q:
-        def __init__(self, **kwargs):
-            self.filters = kwargs
+from firestore_backend import Avg
 
-import datetime
-import xlwt
-from django.http import HttpResponse
+import asyncio
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
 
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
-from sklearn.metrics import accuracy_score
-from sklearn.tree import DecisionTreeClassifier
 
 # Create your views here.
 from Remote_User.models import ClientRegister_Model,mortality_prediction,detection_ratio,detection_accuracy
+from exports import EXPORT_FORMATS, EXPORT_COLUMNS, cell_value, parquet_available
+
+PREDICTIONS_PAGE_SIZE = 50
+EXPORT_CHUNK_SIZE = 1000
+# .xls sheets hold 65,536 rows, one of which is the header
+XLS_MAX_ROWS = 65536
 
 
 def serviceproviderlogin(request):
@@ -39,41 +32,28 @@ def serviceproviderlogin(request):
 
     return render(request,'SProvider/serviceproviderlogin.html')
 
-def View_All_Predicted_Hospital_Morality_Prediction_Ratio(request):
-    detection_ratio.objects.delete_all()
-    ratio = ""
-    kword = 'Good'
-    print(kword)
-    obj = mortality_prediction.objects.filter(Q(Prediction=kword))
-    obj1 = mortality_prediction.objects.all()
-    count = obj.count();
-    count1 = obj1.count();
-    if count1 > 0:
-        ratio = (count / count1) * 100
-        if ratio != 0:
-            detection_ratio.objects.create(names=kword, ratio=ratio)
-
-    ratio12 = ""
-    kword12 = 'Bad'
-    print(kword12)
-    obj12 = mortality_prediction.objects.filter(Q(Prediction=kword12))
-    obj112 = mortality_prediction.objects.all()
-    count12 = obj12.count();
-    count112 = obj112.count();
-    if count112 > 0:
-        ratio12 = (count12 / count112) * 100
-        if ratio12 != 0:
-            detection_ratio.objects.create(names=kword12, ratio=ratio12)
-
-    obj = detection_ratio.objects.all()
+async def _prediction_ratios():
+    """Good/Bad percentages from the materialized Prediction counters"""
+    counts = await mortality_prediction.objects.acounter_values('Prediction')
+    total = sum(counts.values())
+    ratios = []
+    if total > 0:
+        for kword in ('Good', 'Bad'):
+            ratio = (counts.get(kword, 0) / total) * 100
+            if ratio != 0:
+                ratios.append(detection_ratio(names=kword, ratio=ratio))
+    return ratios
+
+async def View_All_Predicted_Hospital_Morality_Prediction_Ratio(request):
+    obj = await _prediction_ratios()
     return render(request, 'SProvider/View_All_Predicted_Hospital_Morality_Prediction_Ratio.html', {'objs': obj})
 
 def View_Remote_Users(request):
-    obj=ClientRegister_Model.objects.all()
+    obj=ClientRegister_Model.objects.only('username', 'email', 'gender', 'address', 'phoneno', 'country', 'state', 'city')
     return render(request,'SProvider/View_Remote_Users.html',{'objects':obj})
 
-def charts(request,chart_type):
-    chart1 = detection_ratio.objects.values('names').annotate(dcount=Avg('ratio'))
+async def charts(request,chart_type):
+    chart1 = [{'names': obj.names, 'dcount': obj.ratio} for obj in await _prediction_ratios()]
     return render(request,"SProvider/charts.html", {'form':chart1, 'chart_type':chart_type})
 
 def charts1(request,chart_type):
@@ -81,8 +61,15 @@ def charts1(request,chart_type):
     return render(request,"SProvider/charts1.html", {'form':chart1, 'chart_type':chart_type})
 
 def View_All_Predicted_Hospital_Morality_Prediction(request):
-    obj =mortality_prediction.objects.all()
-    return render(request, 'SProvider/View_All_Predicted_Hospital_Morality_Prediction.html', {'list_objects': obj})
+    # One page at a time, resuming after the last document id of the previous page
+    after = request.GET.get('after')
+    obj = mortality_prediction.objects.order_by('id')
+    if after:
+        obj = obj.start_after(after)
+    page = list(obj.limit(PREDICTIONS_PAGE_SIZE + 1))
+    next_cursor = page[PREDICTIONS_PAGE_SIZE - 1].id if len(page) > PREDICTIONS_PAGE_SIZE else None
+    return render(request, 'SProvider/View_All_Predicted_Hospital_Morality_Prediction.html',
+                  {'list_objects': page[:PREDICTIONS_PAGE_SIZE], 'next_cursor': next_cursor, 'after': after})
 
 def likeschart(request,like_chart):
     charts =detection_accuracy.objects.values('names').annotate(dcount=Avg('ratio'))
@@ -90,6 +77,25 @@ def likeschart(request,like_chart):
 
 
 def Download_Predicted_DataSets(request):
+    # ?format=xlsx (default), csv or parquet stream straight from a paginated iterator;
+    # xls is the legacy in-memory workbook and is capped at 65,536 rows
+    export_format = request.GET.get('format', 'xlsx')
+    if export_format == 'xls':
+        return _download_xls()
+    if export_format not in EXPORT_FORMATS or (export_format == 'parquet' and not parquet_available()):
+        return HttpResponse("Unsupported export format: %s" % export_format, status=400)
+
+    stream, content_type, extension = EXPORT_FORMATS[export_format]
+    rows = mortality_prediction.objects.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    response = StreamingHttpResponse(stream(rows), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="Predicted_Datasets.%s"' % extension
+    return response
+
+def _download_xls():
+    if mortality_prediction.objects.count() >= XLS_MAX_ROWS:
+        return HttpResponse("Too many rows for .xls; use ?format=xlsx or ?format=csv", status=400)
+
+    import xlwt
 
     response = HttpResponse(content_type='application/ms-excel')
     # decide file name
@@ -103,136 +109,38 @@ def Download_Predicted_DataSets(request):
     font_style = xlwt.XFStyle()
     # headers are bold
     font_style.font.bold = True
-    # writer = csv.writer(response)
-    obj = mortality_prediction.objects.all()
-    data = obj  # dummy method to fetch data.
+    for col_num, column in enumerate(EXPORT_COLUMNS):
+        ws.write(row_num, col_num, column, font_style)
+    data = mortality_prediction.objects.iterator(chunk_size=EXPORT_CHUNK_SIZE)
     for my_row in data:
         row_num = row_num + 1
-
-        ws.write(row_num, 0, my_row.Fid, font_style)
-        ws.write(row_num, 1, my_row.PatientId, font_style)
-        ws.write(row_num, 2, my_row.ICU_AppointmentID, font_style)
-        ws.write(row_num, 3, my_row.Gender, font_style)
-        ws.write(row_num, 4, my_row.ScheduledDay, font_style)
-        ws.write(row_num, 5, my_row.AppointmentDay, font_style)
-        ws.write(row_num, 6, my_row.Age, font_style)
-        ws.write(row_num, 7, my_row.Scheduled_Doctor, font_style)
-        ws.write(row_num, 8, my_row.Scholarship, font_style)
-        ws.write(row_num, 9, my_row.Hipertension, font_style)
-        ws.write(row_num, 10, my_row.Diabetes, font_style)
-        ws.write(row_num, 11, my_row.Alcoholism, font_style)
-        ws.write(row_num, 12, my_row.Handcap, font_style)
-        ws.write(row_num, 13, my_row.SMS_received, font_style)
-        ws.write(row_num, 14, my_row.Patient_Diagnosis, font_style)
-        ws.write(row_num, 15, my_row.Prediction, font_style)
+        for col_num, column in enumerate(EXPORT_COLUMNS):
+            ws.write(row_num, col_num, cell_value(getattr(my_row, column, None)))
 
     wb.save(response)
     return response
 
-def train_model(request):
-    detection_accuracy.objects.delete_all()
-
-    df = pd.read_csv('Datasets.csv')
-
-    def apply_response(Label):
-        if (Label == 0):
-            return 0  # Good
-        elif (Label == 1):
-            return 1  # Bad
-
-    df['results'] = df['Label'].apply(apply_response)
-
-    X = df['Fid']
-    y = df['results']
-
-    print("Fid")
-    print(X)
-    print("Results")
-    print(y)
-
-    cv = CountVectorizer()
-    X = cv.fit_transform(X)
-
-    models = []
-    from sklearn.model_selection import train_test_split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.20)
-    X_train.shape, X_test.shape, y_train.shape
-
-
-    print(X_test)
-
-    print("Naive Bayes")
-
-    from sklearn.naive_bayes import MultinomialNB
-    NB = MultinomialNB()
-    NB.fit(X_train, y_train)
-    predict_nb = NB.predict(X_test)
-    naivebayes = accuracy_score(y_test, predict_nb) * 100
-    print(naivebayes)
-    print(confusion_matrix(y_test, predict_nb))
-    print(classification_report(y_test, predict_nb))
-    models.append(('naive_bayes', NB))
-    detection_accuracy.objects.create(names="Naive Bayes", ratio=naivebayes)
-
-    # SVM Model
-    print("SVM")
-    from sklearn import svm
-    lin_clf = svm.LinearSVC()
-    lin_clf.fit(X_train, y_train)
-    predict_svm = lin_clf.predict(X_test)
-    svm_acc = accuracy_score(y_test, predict_svm) * 100
-    print(svm_acc)
-    print("CLASSIFICATION REPORT")
-    print(classification_report(y_test, predict_svm))
-    print("CONFUSION MATRIX")
-    print(confusion_matrix(y_test, predict_svm))
-    models.append(('svm', lin_clf))
-    detection_accuracy.objects.create(names="SVM", ratio=svm_acc)
-
-    print("Logistic Regression")
-
-    from sklearn.linear_model import LogisticRegression
-    reg = LogisticRegression(random_state=0, solver='lbfgs').fit(X_train, y_train)
-    y_pred = reg.predict(X_test)
-    print("ACCURACY")
-    print(accuracy_score(y_test, y_pred) * 100)
-    print("CLASSIFICATION REPORT")
-    print(classification_report(y_test, y_pred))
-    print("CONFUSION MATRIX")
-    print(confusion_matrix(y_test, y_pred))
-    models.append(('logistic', reg))
-    detection_accuracy.objects.create(names="Logistic Regression", ratio=accuracy_score(y_test, y_pred) * 100)
-
-    print("Decision Tree Classifier")
-    dtc = DecisionTreeClassifier()
-    dtc.fit(X_train, y_train)
-    dtcpredict = dtc.predict(X_test)
-    print("ACCURACY")
-    print(accuracy_score(y_test, dtcpredict) * 100)
-    print("CLASSIFICATION REPORT")
-    print(classification_report(y_test, dtcpredict))
-    print("CONFUSION MATRIX")
-    print(confusion_matrix(y_test, dtcpredict))
-    models.append(('DecisionTreeClassifier', dtc))
-    detection_accuracy.objects.create(names="Decision Tree Classifier", ratio=accuracy_score(y_test, dtcpredict) * 100)
-
-    print("SGD Classifier")
-    from sklearn.linear_model import SGDClassifier
-    sgd_clf = SGDClassifier(loss='hinge', penalty='l2', random_state=0)
-    sgd_clf.fit(X_train, y_train)
-    sgdpredict = sgd_clf.predict(X_test)
-    print("ACCURACY")
-    print(accuracy_score(y_test, sgdpredict) * 100)
-    print("CLASSIFICATION REPORT")
-    print(classification_report(y_test, sgdpredict))
-    print("CONFUSION MATRIX")
-    print(confusion_matrix(y_test, sgdpredict))
-    models.append(('SGDClassifier', sgd_clf))
-    detection_accuracy.objects.create(names="SGD Classifier", ratio=accuracy_score(y_test, sgdpredict) * 100)
-
-    csv_format = 'Results.csv'
-    df.to_csv(csv_format, index=False)
-    df.to_markdown
-
-    obj = detection_accuracy.objects.all()
-    return render(request,'SProvider/train_model.html', {'objs': obj})
\ No newline at end of file
+async def train_model(request):
+    # Imported on first use: the training stack (sklearn, scipy, pandas) is slow to import
+    from training_jobs import ajob_status, submit_training
+
+    # Training runs in the background; the page polls train_model_status until it finishes
+    job_id = request.GET.get('job')
+    if not job_id:
+        try:
+            job_id = await sync_to_async(submit_training)(request.GET.get('mode', 'full'))
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        return redirect('%s?job=%s' % (request.path, job_id))
+
+    # The accuracy table and the job document are independent reads, so they run concurrently
+    obj, job = await asyncio.gather(detection_accuracy.objects.only('names', 'ratio').alist(), ajob_status(job_id))
+    return render(request,'SProvider/train_model.html', {'objs': obj, 'job': job, 'job_id': job_id})
+
+def train_model_status(request, job_id):
+    from training_jobs import job_status
+
+    job = job_status(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Unknown training job'}, status=404)
+    return JsonResponse(job)
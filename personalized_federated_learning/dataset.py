@@ -0,0 +1,162 @@
+"""Typed loader for Datasets.csv with an on-disk columnar cache.
+
+The CSV is parsed once with explicit dtypes and saved next to a small
+manifest as Parquet (pickle when pyarrow is missing). Later loads read the
+binary copy as long as the CSV's size and mtime, or failing that its SHA-1,
+still match the manifest.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+import pandas as pd
+from django.conf import settings
+
+DATASET_FILE = 'Datasets.csv'
+DATETIME_COLUMNS = ['ScheduledDay', 'AppointmentDay']
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+FLAG_COLUMNS = ['Scholarship', 'Hipertension', 'Diabetes', 'Alcoholism', 'Handcap', 'SMS_received']
+DTYPES = {
+    'Fid': 'str',
+    'PatientId': 'int64',
+    'ICU_AppointmentID': 'int64',
+    'Gender': 'category',
+    'Age': 'int16',
+    'Scheduled_Doctor': 'category',
+    'Patient_Diagnosis': 'category',
+    'Label': 'int8',
+    **{column: 'int8' for column in FLAG_COLUMNS},
+}
+# Label values the models are trained on: 0 = Good, 1 = Bad
+LABEL_VALUES = (0, 1)
+
+logger = logging.getLogger(__name__)
+_lock = threading.Lock()
+_loaded = {}
+
+
+def dataset_path():
+    return os.path.join(settings.BASE_DIR, DATASET_FILE)
+
+
+def _cache_dir():
+    return getattr(settings, 'DATASET_CACHE_DIR', os.path.join(settings.BASE_DIR, 'dataset_cache'))
+
+
+def _sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_format():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return 'pickle'
+    return 'parquet'
+
+
+def read_csv(path):
+    """Parse the CSV with the dataset's dtypes (no cache)"""
+    df = pd.read_csv(path, dtype=DTYPES)
+    for column in DATETIME_COLUMNS:
+        parsed = pd.to_datetime(df[column], utc=True, format=DATETIME_FORMAT, errors='coerce')
+        invalid = int(parsed.isna().sum() - df[column].isna().sum())
+        if invalid:
+            # The file has a few impossible dates such as 2022-02-29
+            logger.warning("%s: %d invalid dates read as NaT", column, invalid)
+        df[column] = parsed
+    return df
+
+
+def raw_columns(columns=DATETIME_COLUMNS, path=None):
+    """Columns exactly as written in the CSV, e.g. to write dates that did not parse back unchanged"""
+    return pd.read_csv(path or dataset_path(), usecols=columns, dtype=str, keep_default_na=False)
+
+
+def _read_cache(cache_path, fmt):
+    if fmt == 'parquet':
+        return pd.read_parquet(cache_path)
+    return pd.read_pickle(cache_path)
+
+
+def _write_cache(df, cache_path, fmt):
+    tmp_path = '%s.%s.tmp' % (cache_path, uuid.uuid4().hex)
+    if fmt == 'parquet':
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def _load_cached(path):
+    stat = os.stat(path)
+    directory = _cache_dir()
+    name = os.path.splitext(os.path.basename(path))[0]
+    manifest_path = os.path.join(directory, name + '.json')
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    cache_path = os.path.join(directory, manifest.get('file', ''))
+    fresh = manifest.get('size') == stat.st_size and manifest.get('mtime_ns') == stat.st_mtime_ns
+    if not fresh and manifest.get('size') == stat.st_size:
+        # Touched but possibly unchanged (e.g. a fresh checkout): compare contents
+        fresh = manifest.get('sha1') == _sha1(path)
+    if fresh and os.path.exists(cache_path):
+        try:
+            df = _read_cache(cache_path, manifest['format'])
+        except Exception as e:
+            logger.warning("Dataset cache unreadable, rebuilding: %s", e)
+        else:
+            if manifest.get('mtime_ns') != stat.st_mtime_ns:
+                manifest['mtime_ns'] = stat.st_mtime_ns
+                _write_manifest(manifest_path, manifest)
+            return df
+
+    df = read_csv(path)
+    fmt = _cache_format()
+    manifest = {'file': '%s.%s' % (name, fmt), 'format': fmt, 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns, 'sha1': _sha1(path)}
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _write_cache(df, os.path.join(directory, manifest['file']), fmt)
+        _write_manifest(manifest_path, manifest)
+    except OSError as e:
+        logger.warning("Could not write dataset cache: %s", e)
+    return df
+
+
+def _write_manifest(manifest_path, manifest):
+    tmp_path = '%s.%s.tmp' % (manifest_path, uuid.uuid4().hex)
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def load_dataset(path=None):
+    """Typed DataFrame of the dataset, kept in memory until the file changes.
+
+    Callers get a shallow copy, so adding columns does not touch the shared frame.
+    """
+    path = path or dataset_path()
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        entry = _loaded.get(path)
+        if entry is None or entry[0] != key:
+            entry = _loaded[path] = (key, _load_cached(path))
+    return entry[1].copy(deep=False)
+
+
+def label_results(labels):
+    """Vectorized apply_response: 0/1 labels pass through, anything else becomes missing"""
+    return labels.where(labels.isin(LABEL_VALUES))
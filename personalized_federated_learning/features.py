@@ -0,0 +1,115 @@
+"""Stateless featurizers for the prediction models."""
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import FeatureHasher
+
+from dataset import FLAG_COLUMNS
+
+N_HASH_FEATURES = 2 ** 18
+# Ports below this are service ports (443, 80, ...); the rest are ephemeral client ports
+SERVICE_PORT_LIMIT = 1024
+# Columns of ClinicalEncoder's output, in order
+CLINICAL_FEATURES = (['Age', 'Male', 'Diagnosed'] + FLAG_COLUMNS + ['LeadDays', 'SameDay']
+                     + ['AppointmentWeekday%d' % day for day in range(7)])
+
+
+def fid_tokens(fid):
+    """Split a flow id ``srcip-dstip-srcport-dstport-protocol`` into named tokens"""
+    parts = str(fid).split('-')
+    if len(parts) != 5:
+        return ['fid=' + str(fid)]
+    src, dst, sport, dport, protocol = parts
+    tokens = ['src=' + src, 'dst=' + dst, 'src24=' + src.rsplit('.', 1)[0], 'dst24=' + dst.rsplit('.', 1)[0],
+              'sport=' + sport, 'dport=' + dport, 'proto=' + protocol]
+    for port in (sport, dport):
+        if port.isdigit() and int(port) < SERVICE_PORT_LIMIT:
+            tokens.append('service=%s/%s' % (port, protocol))
+    return tokens
+
+
+class FidHasher(BaseEstimator, TransformerMixin):
+    """Hash the parsed parts of each Fid into a fixed-width sparse count matrix.
+
+    There is no vocabulary to learn, so fit() is a no-op, any Fid can be
+    transformed without having been seen, and the output width never changes,
+    which is what incremental and federated training need.
+    """
+    def __init__(self, n_features=N_HASH_FEATURES):
+        self.n_features = n_features
+
+    def fit(self, X=None, y=None):
+        return self
+
+    def transform(self, X):
+        hasher = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False)
+        return hasher.transform(fid_tokens(fid) for fid in X)
+
+
+def _numbers(frame, column):
+    if column not in frame:
+        return np.zeros(len(frame), dtype=np.float32)
+    return pd.to_numeric(frame[column], errors='coerce').fillna(0).to_numpy(dtype=np.float32)
+
+
+def _matches(frame, column, value):
+    if column not in frame:
+        return np.zeros(len(frame), dtype=bool)
+    return frame[column].astype(str).str.strip().str.lower().eq(value).to_numpy()
+
+
+def _dates(frame, column):
+    if column not in frame:
+        return pd.Series(pd.NaT, index=frame.index, dtype='datetime64[ns, UTC]')
+    values = frame[column]
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values if values.dt.tz is not None else values.dt.tz_localize('UTC')
+    return pd.to_datetime(values, utc=True, format='ISO8601', errors='coerce')
+
+
+class ClinicalEncoder(BaseEstimator, TransformerMixin):
+    """Encode the clinical and scheduling columns as a dense float32 matrix (see CLINICAL_FEATURES).
+
+    Everything is computed column-at-a-time; missing or unparsable values
+    become 0. All features are non-negative so MultinomialNB can use them.
+    """
+    def fit(self, X=None, y=None):
+        return self
+
+    def transform(self, frame):
+        matrix = np.zeros((len(frame), len(CLINICAL_FEATURES)), dtype=np.float32)
+        matrix[:, 0] = np.clip(_numbers(frame, 'Age'), 0, 120) / 100
+        matrix[:, 1] = _matches(frame, 'Gender', 'm')
+        matrix[:, 2] = _matches(frame, 'Patient_Diagnosis', 'yes')
+        for offset, column in enumerate(FLAG_COLUMNS, start=3):
+            matrix[:, offset] = np.clip(_numbers(frame, column), 0, None)
+
+        scheduled = _dates(frame, 'ScheduledDay')
+        appointment = _dates(frame, 'AppointmentDay')
+        lead_days = (appointment.dt.normalize() - scheduled.dt.normalize()).dt.days
+        known = lead_days.notna().to_numpy()
+        lead_days = lead_days.fillna(0).clip(lower=0).to_numpy(dtype=np.float32)
+        lead_column = CLINICAL_FEATURES.index('LeadDays')
+        matrix[:, lead_column] = np.log1p(lead_days)
+        matrix[:, lead_column + 1] = known & (lead_days == 0)
+
+        weekday = appointment.dt.weekday
+        has_weekday = weekday.notna().to_numpy()
+        first_weekday = CLINICAL_FEATURES.index('AppointmentWeekday0')
+        matrix[np.flatnonzero(has_weekday), first_weekday + weekday[has_weekday].to_numpy(dtype=np.intp)] = 1
+        return matrix
+
+
+class PatientFeatures(BaseEstimator, TransformerMixin):
+    """Hashed Fid tokens followed by the ClinicalEncoder columns, as one CSR matrix"""
+    def __init__(self, n_features=N_HASH_FEATURES):
+        self.n_features = n_features
+
+    def fit(self, X=None, y=None):
+        return self
+
+    def transform(self, frame):
+        hashed = FidHasher(self.n_features).transform(frame['Fid'])
+        clinical = sp.csr_matrix(ClinicalEncoder().transform(frame))
+        return sp.hstack([hashed, clinical], format='csr')
@@ -0,0 +1,224 @@
+"""Federated training over simulated hospital sites.
+
+Datasets.csv is split into clients by Scheduled_Doctor. Every round the
+server sends the global linear model to each client, the clients run a few
+local epochs of SGD in a process pool, and the server averages the returned
+weights by client size (FedAvg). After the last round each client fine-tunes
+the global model on its own rows to get a personalized model.
+
+Only model updates travel between server and workers, as deltas against the
+last global model encoded by an update_codec codec; each worker featurizes
+only its own clients' rows, once, in its initializer.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import train_test_split
+
+from features import N_HASH_FEATURES, CLINICAL_FEATURES, PatientFeatures
+from training import load_training_data
+from update_codec import RawCodec
+
+CLASSES = np.array([0, 1])
+OTHER_SITES = "Other sites"
+# Per-worker state, filled by _init_worker: client data, error-feedback residuals and
+# the worker's copy of the global model
+_clients = {}
+_residuals = {}
+_state = {}
+
+
+def partition_by_doctor(df, num_clients=None):
+    """Row positions per simulated site; past num_clients - 1 doctors the rest share one client"""
+    labelled = df['results'].notna().to_numpy()
+    doctors = df['Scheduled_Doctor'].astype(str)
+    counts = doctors[labelled].value_counts()
+    if num_clients is None or num_clients >= len(counts):
+        own = list(counts.index)
+    else:
+        own = list(counts.index[:num_clients - 1])
+    sites = {doctor: np.flatnonzero(labelled & (doctors == doctor).to_numpy()) for doctor in own}
+    rest = np.flatnonzero(labelled & ~doctors.isin(own).to_numpy())
+    if len(rest):
+        sites[OTHER_SITES] = rest
+    return sites
+
+
+def _init_worker(sites, test_size, seed, n_parameters, codec):
+    # Needed when workers are spawned rather than forked
+    import django
+    django.setup()
+
+    df = load_training_data()
+    # Only this worker's sites are featurized; site positions are then offsets into that slice
+    rows = np.concatenate(list(sites.values()))
+    X = PatientFeatures().transform(df.iloc[rows])
+    y = df['results'].to_numpy()[rows].astype(np.int64)
+    start = 0
+    for name, site_rows in sites.items():
+        local = np.arange(start, start + len(site_rows))
+        start += len(site_rows)
+        if len(local) >= 5:
+            train_rows, test_rows = train_test_split(local, test_size=test_size, random_state=seed)
+        else:
+            train_rows, test_rows = local, local[:0]
+        _clients[name] = (X[train_rows], y[train_rows], X[test_rows], y[test_rows])
+        _residuals[name] = np.zeros(n_parameters)
+    _state.update(codec=codec, model=np.zeros(n_parameters), round=0)
+
+
+def _sync(number, payload):
+    """Apply the round's broadcast delta to this worker's copy of the global model, once per round"""
+    if _state['round'] != number:
+        _state['model'] = _state['model'] + _state['codec'].decode(payload)
+        _state['round'] = number
+    return _state['model']
+
+
+def _model(parameters, learning_rate, seed):
+    model = SGDClassifier(loss='log_loss', learning_rate='constant', eta0=learning_rate, random_state=seed)
+    model.coef_ = parameters[np.newaxis, :-1].copy()
+    model.intercept_ = parameters[-1:].copy()
+    return model
+
+
+def _parameters(model):
+    return np.concatenate([model.coef_.ravel(), model.intercept_])
+
+
+def _train(model, X, y, epochs):
+    for _ in range(epochs):
+        model.partial_fit(X, y, classes=CLASSES)
+    return model
+
+
+def _accuracy(parameters, X, y):
+    if not len(y):
+        return None
+    predicted = (X @ parameters[:-1] + parameters[-1] > 0).astype(np.int64)
+    return float((predicted == y).mean())
+
+
+def _local_update(name, number, payload, epochs, learning_rate, seed):
+    """Client side of a round: train from the global model and send back the encoded weight delta"""
+    start = time.perf_counter()
+    parameters = _sync(number, payload)
+    X_train, y_train, X_test, y_test = _clients[name]
+    model = _train(_model(parameters, learning_rate, seed), X_train, y_train, epochs)
+    # Error feedback: what the codec dropped last time rides along with this update
+    delta = _parameters(model) - parameters + _residuals[name]
+    codec = _state['codec']
+    encoded = codec.encode(delta)
+    _residuals[name] = delta - codec.decode(encoded)
+    return {
+        'client': name,
+        'rows': len(y_train),
+        'payload': encoded,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _personalize(name, number, payload, epochs, learning_rate, seed):
+    """Fine-tune the final global model on one client's rows and compare test accuracy"""
+    parameters = _sync(number, payload)
+    X_train, y_train, X_test, y_test = _clients[name]
+    model = _train(_model(parameters, learning_rate, seed), X_train, y_train, epochs)
+    return {
+        'client': name,
+        'train_rows': len(y_train),
+        'test_rows': len(y_test),
+        'global_accuracy': _accuracy(parameters, X_test, y_test),
+        'personalized_accuracy': _accuracy(_parameters(model), X_test, y_test),
+    }
+
+
+def fedavg(deltas, rows):
+    """Average client deltas, each weighted by its number of training rows"""
+    total = float(sum(rows))
+    average = np.zeros_like(deltas[0])
+    for delta, count in zip(deltas, rows):
+        average += delta * (count / total)
+    return average
+
+
+class FederatedResult:
+    """Outcome of run_federated: the global weights plus per-round and per-client reports"""
+    def __init__(self, parameters, rounds, clients, codec_name):
+        self.coef = parameters[np.newaxis, :-1]
+        self.intercept = parameters[-1:]
+        self.rounds = rounds
+        self.clients = clients
+        self.codec_name = codec_name
+
+    def classifier(self):
+        """The global model as a fitted SGDClassifier, ready for the model registry"""
+        model = SGDClassifier(loss='log_loss')
+        model.coef_ = self.coef
+        model.intercept_ = self.intercept
+        model.classes_ = CLASSES
+        model.n_features_in_ = self.coef.shape[1]
+        return model
+
+
+def _assign(sites, workers):
+    """Spread the sites over the workers, largest first onto the least loaded one"""
+    groups = [{} for _ in range(workers)]
+    loads = [0] * workers
+    for name, rows in sorted(sites.items(), key=lambda item: -len(item[1])):
+        target = loads.index(min(loads))
+        groups[target][name] = rows
+        loads[target] += len(rows)
+    return [group for group in groups if group]
+
+
+def run_federated(rounds=5, num_clients=10, local_epochs=1, personalize_epochs=2, learning_rate=0.01,
+                  workers=None, test_size=0.2, seed=0, min_rows=1, codec=None):
+    """Run FedAvg rounds and the personalization step; codec compresses both directions (raw by default)"""
+    codec = codec or RawCodec()
+    df = load_training_data()
+    sites = {name: rows for name, rows in partition_by_doctor(df, num_clients).items() if len(rows) >= min_rows}
+    workers = workers or min(len(sites), os.cpu_count() or 1)
+    n_parameters = N_HASH_FEATURES + len(CLINICAL_FEATURES) + 1
+    print("Federated training: %d clients, %d rounds, %d workers, %s updates" % (
+        len(sites), rounds, workers, codec.name))
+
+    # The global model on the server, and the copy the clients have rebuilt from the broadcasts
+    model = np.zeros(n_parameters)
+    client_model = np.zeros(n_parameters)
+    reports = []
+    with ExitStack() as stack:
+        # One single-process pool per group, so a client always runs where its residual lives
+        pools = {}
+        for group in _assign(sites, workers):
+            pool = stack.enter_context(ProcessPoolExecutor(
+                max_workers=1, initializer=_init_worker, initargs=(group, test_size, seed, n_parameters, codec)))
+            pools.update((name, pool) for name in group)
+
+        def broadcast(number, task, *args):
+            nonlocal client_model
+            payload = codec.encode(model - client_model)
+            client_model = client_model + codec.decode(payload)
+            futures = [pools[name].submit(task, name, number, payload, *args) for name in sites]
+            return payload, [future.result() for future in futures]
+
+        for number in range(1, rounds + 1):
+            start = time.perf_counter()
+            payload, updates = broadcast(number, _local_update, local_epochs, learning_rate, seed + number)
+            model = client_model + fedavg([codec.decode(update['payload']) for update in updates],
+                                          [update['rows'] for update in updates])
+            report = {
+                'round': number,
+                'seconds': time.perf_counter() - start,
+                'bytes_down': len(payload) * len(sites),
+                'bytes_up': sum(len(update['payload']) for update in updates),
+                'client_seconds': max(update['seconds'] for update in updates),
+            }
+            reports.append(report)
+            print("Round %(round)d: %(seconds).2fs, %(bytes_down)d bytes down, %(bytes_up)d bytes up" % report)
+
+        _, clients = broadcast(rounds + 1, _personalize, personalize_epochs, learning_rate, seed)
+    return FederatedResult(client_model, reports, clients, codec.name)
@@ -1,9 +1,33 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import logging
 import os
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import numpy as np
 import uuid
-from collections import defaultdict
+import atexit
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+
+# Field path Firestore uses for the document key (key-only projections)
+DOCUMENT_ID = '__name__'
+# Firestore rejects write batches with more than 500 operations
+MAX_BATCH_WRITES = 500
+# Number of batch commits kept in flight at once by bulk writes
+BULK_WRITE_CONCURRENCY = 8
+# Collection holding the sharded per-value counters maintained by FirestoreManager
+COUNTER_COLLECTION = 'counters'
+COUNTER_SHARDS = 10
+# Recounts retried by rebuild_counters() while creates keep moving the counters
+COUNTER_REBUILD_ATTEMPTS = 3
+# Document keys fetched per key-only page when deleting
+DELETE_PAGE_SIZE = 5000
 
 class Q:
     """Simple Q object implementation for Firestore queries"""
@@ -20,58 +44,204 @@ class Q:
         # In a full implementation, you'd need more complex logic
         return self
 
+class QueryCache:
+    """Process-local LRU of query results that expire after ``ttl`` seconds.
+
+    Entries are keyed by database, collection and the full query shape. A
+    write through FirestoreManager drops every entry of its collection, so
+    only writes from other processes can be served stale, for at most ttl.
+    Cached results are shared between callers and must not be modified.
+    """
+    def __init__(self, max_entries=256, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Bumped by invalidate(); a result fetched under an older generation is not stored
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def generation(self, scope):
+        with self._lock:
+            return self._generations[scope]
+
+    def set(self, key, value, generation):
+        with self._lock:
+            if self._generations[key[0]] != generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, scope):
+        """Forget every result cached for one (database, collection) scope"""
+        with self._lock:
+            self._generations[scope] += 1
+            for key in [key for key in self._entries if key[0] == scope]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+_cache_config = getattr(settings, 'FIRESTORE_CONFIG', {})
+query_cache = QueryCache(max_entries=_cache_config.get('cache_size', 256), ttl=_cache_config.get('cache_ttl', 30.0))
+
+logger = logging.getLogger(__name__)
+
+# Placeholder for a FirestoreManager whose client has not been looked up yet
+_UNRESOLVED = object()
+
+
+def _open_firestore(config):
+    # firebase_admin pulls in the gRPC client stack, so it is only imported once a query needs it
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    try:
+        # Initialize Firebase Admin SDK
+        if not firebase_admin._apps:
+            # You'll need to place your serviceAccountKey.json in the project root
+            service_account_path = os.path.join(settings.BASE_DIR, 'serviceAccountKey.json')
+            if os.path.exists(service_account_path):
+                cred = credentials.Certificate(service_account_path)
+                firebase_admin.initialize_app(cred)
+            else:
+                # For development, you can use default credentials
+                firebase_admin.initialize_app()
+
+        db = firestore.client()
+        logger.info("Firestore initialized")
+        return db
+    except Exception as e:
+        logger.warning("Error initializing Firestore: %s", e)
+        # Fallback for development
+        try:
+            firebase_admin.initialize_app()
+            db = firestore.client()
+            logger.info("Firestore initialized with default credentials")
+            return db
+        except Exception as e2:
+            logger.error("Failed to initialize Firestore: %s", e2)
+    return None
+
+
+def _open_memory(config):
+    from firestore_memory import InMemoryFirestore
+    logger.info("Using the in-memory Firestore stand-in")
+    return InMemoryFirestore(latency=config.get('memory_latency', 0.0))
+
+
+def _open_sqlite(config):
+    from firestore_sqlite import SQLiteFirestore
+    path = config.get('sqlite_path', os.path.join(settings.BASE_DIR, 'firestore.sqlite3'))
+    logger.info("Using SQLite storage at %s", path)
+    return SQLiteFirestore(path, indexes_file=os.path.join(settings.BASE_DIR, 'firestore.indexes.json'))
+
+
+# FIRESTORE_CONFIG['backend'] -> function returning a database (see storage_engine), or None if unavailable
+STORAGE_ENGINES = {
+    'firestore': _open_firestore,
+    'memory': _open_memory,
+    'sqlite': _open_sqlite,
+}
+
+
+def open_storage_engine(name, config=None):
+    if name not in STORAGE_ENGINES:
+        raise ImproperlyConfigured("Unknown FIRESTORE_CONFIG backend %r, expected one of: %s" % (
+            name, ', '.join(STORAGE_ENGINES)))
+    return STORAGE_ENGINES[name](config or {})
+
+
 class FirestoreClient:
     _instance = None
     _db = None
+    # Managers first touched from concurrent async queries must still share one client
+    _lock = threading.Lock()
 
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(FirestoreClient, cls).__new__(cls)
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(FirestoreClient, cls).__new__(cls)
         return cls._instance
 
     def __init__(self):
-        if self._db is None:
-            self.initialize_firestore()
+        with self._lock:
+            if self._db is None:
+                self.initialize_firestore()
 
     def initialize_firestore(self):
-        try:
-            # Initialize Firebase Admin SDK
-            if not firebase_admin._apps:
-                # You'll need to place your serviceAccountKey.json in the project root
-                service_account_path = os.path.join(settings.BASE_DIR, 'serviceAccountKey.json')
-                if os.path.exists(service_account_path):
-                    cred = credentials.Certificate(service_account_path)
-                    firebase_admin.initialize_app(cred)
-                else:
-                    # For development, you can use default credentials
-                    firebase_admin.initialize_app()
-            
-            self._db = firestore.client()
-            print("Firestore initialized successfully")
-        except Exception as e:
-            print(f"Error initializing Firestore: {e}")
-            # Fallback for development
-            try:
-                firebase_admin.initialize_app()
-                self._db = firestore.client()
-                print("Firestore initialized with default credentials")
-            except Exception as e2:
-                print(f"Failed to initialize Firestore: {e2}")
+        config = getattr(settings, 'FIRESTORE_CONFIG', {})
+        backend = config.get('backend', 'firestore')
+        self._db = open_storage_engine(backend, config)
+        fallback = config.get('fallback')
+        if self._db is None and fallback and fallback != backend:
+            # Without this every query would quietly come back empty
+            logger.warning("%s backend unavailable, falling back to %s", backend, fallback)
+            self._db = open_storage_engine(fallback, config)
+        if self._db is None:
+            logger.error("No database: the %s backend could not be initialized and no fallback took over "
+                         "(see FIRESTORE_FALLBACK); queries will return nothing and writes are dropped", backend)
 
     def get_db(self):
         return self._db
 
 class FirestoreQuerySet:
-    def __init__(self, collection_name, db):
+    def __init__(self, collection_name, db, manager=None):
         self.collection_name = collection_name
         self.db = db
+        # Owning FirestoreManager, told about deletes so it can keep its counters right
+        self.manager = manager
         self.filters = []
+        # Field mask set by only(); None fetches whole documents
+        self.projection = None
+        # [(field, descending)] set by order_by(); 'id' orders by document key
+        self.orders = []
+        self.limit_count = None
+        self.cursor = None
         self._data = None
 
-    def filter(self, *args, **kwargs):
-        new_qs = FirestoreQuerySet(self.collection_name, self.db)
+    def _clone(self):
+        new_qs = FirestoreQuerySet(self.collection_name, self.db, self.manager)
         new_qs.filters = self.filters.copy()
-        
+        new_qs.projection = self.projection
+        new_qs.orders = self.orders.copy()
+        new_qs.limit_count = self.limit_count
+        new_qs.cursor = self.cursor
+        return new_qs
+
+    def filter(self, *args, **kwargs):
+        new_qs = self._clone()
+
         # Handle Q objects
         for arg in args:
             if isinstance(arg, Q):
@@ -87,6 +257,8 @@ class FirestoreQuerySet:
                     # For text search, we'll need to implement this differently
                     new_qs.filters.append((field, '>=', value))
                     new_qs.filters.append((field, '<=', value + '\uf8ff'))
+                elif operator == 'in':
+                    new_qs.filters.append((field, 'in', list(value)))
                 else:
                     new_qs.filters.append((field, '==', value))
             else:
@@ -94,139 +266,865 @@ class FirestoreQuerySet:
         return new_qs
 
     def all(self):
-        new_qs = FirestoreQuerySet(self.collection_name, self.db)
-        new_qs.filters = self.filters.copy()
+        return self._clone()
+
+    def only(self, *fields):
+        """Fetch just these fields (plus id) using a Firestore field mask"""
+        new_qs = self._clone()
+        new_qs.projection = tuple(dict.fromkeys(field for field in fields if field != 'id'))
+        return new_qs
+
+    def values_list(self, *fields, flat=False):
+        """Django-style values_list(): tuples of fields, or bare values with flat=True"""
+        if flat and len(fields) != 1:
+            raise TypeError("'flat' is not valid when values_list is called with more than one field.")
+        columns = self._columns(fields)
+        if flat:
+            return columns[fields[0]]
+        return list(zip(*(columns[field] for field in fields)))
+
+    def order_by(self, *fields):
+        """Django-style ordering; prefix a field with '-' for descending"""
+        new_qs = self._clone()
+        new_qs.orders = [(field.lstrip('-'), field.startswith('-')) for field in fields]
+        return new_qs
+
+    def limit(self, count):
+        new_qs = self._clone()
+        new_qs.limit_count = count
         return new_qs
 
+    def start_after(self, cursor):
+        """Resume after a document, given by its id or by a dict of its ordered field values"""
+        new_qs = self._clone()
+        new_qs.cursor = cursor
+        return new_qs
+
+    def _order_paths(self):
+        """Ordering sent to Firestore, always ending on the document key so cursors are exact"""
+        orders = [(DOCUMENT_ID if field == 'id' else field, descending) for field, descending in self.orders]
+        if not orders:
+            # Firestore requires the first ordering to be on a field filtered by inequality
+            orders = [(field, False) for field, operator, _ in self.filters if operator != '==']
+        if not any(path == DOCUMENT_ID for path, _ in orders):
+            orders.append((DOCUMENT_ID, False))
+        return list(dict.fromkeys(orders))
+
+    def _cursor_values(self, cursor, orders):
+        if isinstance(cursor, dict):
+            return {DOCUMENT_ID if key == 'id' else key: value for key, value in cursor.items()}
+        if all(path == DOCUMENT_ID for path, _ in orders):
+            return {DOCUMENT_ID: cursor}
+        # Ordered by other fields: one point read recovers the cursor document's values
+        data = self.db.collection(self.collection_name).document(cursor).get().to_dict() or {}
+        data[DOCUMENT_ID] = cursor
+        return data
+
+    def _query(self, cursor=None, limit=None, paginate=False):
+        query = self.db.collection(self.collection_name)
+        for field, operator, value in self.filters:
+            query = query.where(field, operator, value)
+        cursor = cursor if cursor is not None else self.cursor
+        ordered = paginate or self.orders or cursor is not None
+        orders = self._order_paths() if ordered else []
+        for path, descending in orders:
+            query = query.order_by(path, direction='DESCENDING' if descending else 'ASCENDING')
+        if self.projection is not None:
+            # Ordered fields stay in the mask so the next page's cursor can be built
+            fields = list(dict.fromkeys(list(self.projection) + [path for path, _ in orders if path != DOCUMENT_ID]))
+            query = query.select(fields or [DOCUMENT_ID])
+        if cursor is not None:
+            query = query.start_after(self._cursor_values(cursor, orders))
+        limit = limit if limit is not None else self.limit_count
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def _cached(self, kind, fetch, *details):
+        """Serve fetch() from query_cache unless caching is off for this collection"""
+        if self.manager is None or not self.manager.cache or not query_cache.enabled:
+            return fetch()
+        scope = (id(self.db), self.collection_name)
+        key = (scope, kind, repr(self.filters), self.projection, tuple(self.orders), self.limit_count,
+               repr(self.cursor)) + details
+        found, value = query_cache.get(key)
+        if found:
+            return value
+        generation = query_cache.generation(scope)
+        value = fetch()
+        query_cache.set(key, value, generation)
+        return value
+
+    def _document(self, snapshot):
+        data = snapshot.to_dict() or {}
+        if self.projection is not None:
+            # Fields missing from a document still read back as None
+            data = {field: data.get(field) for field in self.projection}
+        if self.manager is not None:
+            return self.manager.document(snapshot.id, data)
+        return FirestoreDocument(dict(data, id=snapshot.id))
+
+    def iterator(self, chunk_size=500):
+        """Yield documents page by page with cursor pagination, so memory stays bounded"""
+        if self._data is not None:
+            yield from self._data
+            return
+        if self.db is None:
+            return
+        remaining = self.limit_count
+        cursor = self.cursor
+        orders = self._order_paths()
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            snapshots = list(self._query(cursor=cursor, limit=size, paginate=True).stream())
+            for snapshot in snapshots:
+                yield self._document(snapshot)
+            if len(snapshots) < size:
+                return
+            if remaining is not None:
+                remaining -= len(snapshots)
+            last = snapshots[-1]
+            data = last.to_dict() or {}
+            cursor = {path: last.id if path == DOCUMENT_ID else data.get(path) for path, _ in orders}
+
     def count(self):
-        data = self._get_data()
-        return len(data)
+        if self._data is not None:
+            return len(self._data)
+        return self.aggregate(count=Count('id'))['count']
 
-    def annotate(self, **kwargs):
-        """Handle Django-style annotations for aggregations"""
-        # For simplicity, return self - aggregations will be handled in values()
-        return self
+    def aggregate(self, **aggregations):
+        """Django-style aggregate(): run server-side when Firestore supports it"""
+        if self.db is not None and self._data is None and hasattr(self._query(), 'count'):
+            signature = tuple((alias, aggregation.function, aggregation.field)
+                              for alias, aggregation in aggregations.items())
+            result = self._cached('aggregate', lambda: self._server_aggregate(aggregations), signature)
+            if result is not None:
+                return dict(result)
+        fields = [aggregation.field for aggregation in aggregations.values() if aggregation.field not in COUNT_ALL]
+        return aggregate_columns(self._columns(fields), (), aggregations)[0]
 
-    def values(self, *fields):
-        """Handle Django-style values() queries with aggregations"""
-        data = self._get_data()
-        result = []
-        
-        # Group data for aggregations
-        groups = defaultdict(list)
-        
-        for doc in data:
-            if len(fields) == 1:
-                key = getattr(doc, fields[0], None)
-                groups[key].append(doc)
+    def _server_aggregate(self, aggregations):
+        query = self._query()
+        if not hasattr(query, 'count'):
+            # The in-memory stand-in has no aggregation queries
+            return None
+        aggregation_query = None
+        for alias, aggregation in aggregations.items():
+            if aggregation.function not in SERVER_AGGREGATES:
+                return None
+            if aggregation.function == 'count' and aggregation.field not in COUNT_ALL:
+                # The server counts documents; Count(field) skips nulls, so it is evaluated client-side
+                return None
+            target = aggregation_query or query
+            if aggregation.function == 'count':
+                aggregation_query = target.count(alias=alias)
             else:
-                # For multiple fields, create a tuple key
-                key_values = tuple(getattr(doc, field, None) for field in fields)
-                groups[key_values].append(doc)
-        
-        # Convert groups to result format
-        for key, docs in groups.items():
-            if len(fields) == 1:
-                result.append({fields[0]: key, 'dcount': len(docs)})
-            else:
-                doc_dict = {}
-                if isinstance(key, tuple):
-                    for i, field in enumerate(fields):
-                        doc_dict[field] = key[i]
-                else:
-                    doc_dict[fields[0]] = key
-                doc_dict['dcount'] = len(docs)
-                result.append(doc_dict)
-        
-        return result
+                aggregation_query = getattr(target, aggregation.function)(aggregation.field, alias=alias)
+        results = aggregation_query.get()
+        values = {result.alias: result.value for row in results for result in row}
+        for alias, aggregation in aggregations.items():
+            if aggregation.function == 'count':
+                values[alias] = int(values.get(alias) or 0)
+        return values
+
+    def _columns(self, fields):
+        """Fetch only ``fields`` as {field: list}, without building FirestoreDocuments"""
+        fields = list(dict.fromkeys(field for field in fields if field != 'id'))
+        columns = {field: [] for field in fields}
+        columns['id'] = []
+        if self._data is not None:
+            for doc in self._data:
+                columns['id'].append(doc.id)
+                for field in fields:
+                    columns[field].append(getattr(doc, field, None))
+            return columns
+        if self.db is None:
+            return columns
+
+        def fetch():
+            query = self._query().select(fields or [DOCUMENT_ID])
+            for snapshot in query.stream():
+                data = snapshot.to_dict() or {}
+                columns['id'].append(snapshot.id)
+                for field in fields:
+                    columns[field].append(data.get(field))
+            return columns
+        cached = self._cached('columns', fetch, tuple(fields))
+        return {field: list(values) for field, values in cached.items()}
+
+    def columns(self, *fields):
+        """Columnar results: {field: [values]} plus 'id', with no per-document objects.
+
+        Defaults to the model's fields; the cheapest way to read many rows.
+        """
+        if not fields and self.manager is not None and self.manager.row_class is not None:
+            fields = self.manager.row_class._fields
+        return self._columns(fields)
+
+    def values(self, *fields):
+        """Handle Django-style values() queries; chain annotate() to aggregate per group"""
+        return FirestoreValuesQuerySet(self, fields)
 
     def delete(self):
-        """Delete all documents in this queryset"""
+        """Delete all documents in this queryset and return how many there were.
+
+        Keys are paged in with key-only queries and deleted through batched
+        commits that run concurrently with the next page read.
+        """
         if self.db is None:
-            return
-            
-        data = self._get_data()
-        for doc in data:
-            self.db.collection(self.collection_name).document(doc.id).delete()
+            return 0
+
+        collection = self.db.collection(self.collection_name)
+        if self._data is not None:
+            doc_ids = [doc.id for doc in self._data]
+        else:
+            doc_ids = (doc.id for doc in self.only().iterator(chunk_size=DELETE_PAGE_SIZE))
+        deleted = 0
+
+        def operations():
+            nonlocal deleted
+            for doc_id in doc_ids:
+                deleted += 1
+                yield lambda batch, doc_id=doc_id: batch.delete(collection.document(doc_id))
+        commit_in_batches(self.db, operations())
+        if self.manager is not None and deleted:
+            self.manager.reset_counters()
+            self.manager.invalidate_cache()
+        return deleted
 
     def _get_data(self):
         if self._data is None:
             if self.db is None:
                 self._data = []
                 return self._data
-                
-            query = self.db.collection(self.collection_name)
-            for field, operator, value in self.filters:
-                query = query.where(field, operator, value)
-            
-            docs = query.stream()
-            self._data = []
-            for doc in docs:
-                doc_data = doc.to_dict()
-                doc_data['id'] = doc.id
-                self._data.append(FirestoreDocument(doc_data))
+
+            self._data = list(self._cached(
+                'documents', lambda: [self._document(snapshot) for snapshot in self._query().stream()]))
         return self._data
 
     def __iter__(self):
         return iter(self._get_data())
 
+    # Async variants: the blocking engine calls run on worker threads, so independent
+    # queries awaited together (asyncio.gather) overlap instead of running one after another
+
+    async def acount(self):
+        return await _in_thread(self.count)
+
+    async def aaggregate(self, **aggregations):
+        return await _in_thread(self.aggregate, **aggregations)
+
+    async def aget(self, **kwargs):
+        return await _in_thread(self.get, **kwargs)
+
+    async def alist(self):
+        """All documents as a list, served from the query cache like list(queryset)"""
+        return await _in_thread(self._get_data)
+
+    async def aiter(self, chunk_size=500):
+        """Async iterator over the documents, fetching one page per worker-thread call"""
+        rows = self.iterator(chunk_size=chunk_size)
+        while True:
+            page = await _in_thread(lambda: list(islice(rows, chunk_size)))
+            for row in page:
+                yield row
+            if len(page) < chunk_size:
+                return
+
+    def __aiter__(self):
+        return self.aiter()
+
     def __len__(self):
         return len(self._get_data())
 
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.start or index.step or index.stop is None:
+                return self._get_data()[index]
+            return self.limit(index.stop)
+        return self._get_data()[index]
+
     def get(self, **kwargs):
+        if list(kwargs) == ['id'] and not self.filters:
+            return self.get_by_id(kwargs['id'])
         filtered_qs = self.filter(**kwargs)
+        if filtered_qs.limit_count is None and filtered_qs._data is None:
+            # Only the first match is returned, so do not read past it
+            filtered_qs = filtered_qs.limit(1)
         data = filtered_qs._get_data()
         if not data:
             raise Exception("Document not found")
         return data[0]
 
+    def get_by_id(self, doc_id):
+        """Fetch one document by key with a single point read instead of a query"""
+        if self.db is None or not doc_id:
+            raise Exception("Document not found")
+
+        def fetch():
+            snapshot = self.db.collection(self.collection_name).document(str(doc_id)).get()
+            return self._document(snapshot) if snapshot.exists else None
+        doc = self._cached('document', fetch, str(doc_id))
+        if doc is None:
+            raise Exception("Document not found")
+        return doc
+
+class FirestoreValuesQuerySet:
+    """Result of values(*fields): plain dicts, or one row per group once annotated"""
+    def __init__(self, queryset, fields):
+        self.queryset = queryset
+        self.fields = fields
+        self.aggregations = {}
+        self._result = None
+
+    def annotate(self, **aggregations):
+        new_qs = FirestoreValuesQuerySet(self.queryset, self.fields)
+        new_qs.aggregations = {**self.aggregations, **aggregations}
+        return new_qs
+
+    def _get_result(self):
+        if self._result is None:
+            needed = list(self.fields) + [aggregation.field for aggregation in self.aggregations.values()
+                                          if aggregation.field not in COUNT_ALL]
+            columns = self.queryset._columns(needed)
+            if not self.aggregations:
+                self._result = [dict(zip(self.fields, row)) for row in zip(*(columns[f] for f in self.fields))]
+            else:
+                self._result = aggregate_columns(columns, self.fields, self.aggregations)
+        return self._result
+
+    def __iter__(self):
+        return iter(self._get_result())
+
+    def __len__(self):
+        return len(self._get_result())
+
+    def __getitem__(self, index):
+        return self._get_result()[index]
+
+
+def _numeric(values):
+    """Convert a column to float64, mapping missing or non-numeric values to NaN"""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    out = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        try:
+            out[i] = float(value)
+        except (TypeError, ValueError):
+            out[i] = np.nan
+    return out
+
+
+def aggregate_columns(columns, group_fields, aggregations):
+    """Evaluate Count/Sum/Avg/Min/Max per group in one vectorized pass over columns.
+
+    ``columns`` maps field -> list of values (as returned by _columns). Returns
+    one dict per group, holding the group fields and one key per aggregation.
+    """
+    size = len(columns['id'])
+    if group_fields:
+        index = {}
+        codes = np.fromiter(
+            (index.setdefault(key, len(index)) for key in zip(*(columns[f] for f in group_fields))),
+            dtype=np.intp, count=size)
+        keys = list(index)
+    else:
+        codes = np.zeros(size, dtype=np.intp)
+        keys = [()]
+    groups = len(keys)
+
+    results = {}
+    # Per sum, the groups whose values were all integers
+    integral = {}
+    for alias, aggregation in aggregations.items():
+        function = aggregation.function
+        if function == 'count' and aggregation.field in COUNT_ALL:
+            results[alias] = np.bincount(codes, minlength=groups)
+            continue
+        column = columns[aggregation.field]
+        if function == 'count':
+            # Like SQL COUNT(field): the non-null values, whatever their type
+            present = np.fromiter((value is not None for value in column), dtype=bool, count=size)
+            results[alias] = np.bincount(codes[present], minlength=groups)
+            continue
+        values = _numeric(column)
+        valid = ~np.isnan(values)
+        group_codes, values = codes[valid], values[valid]
+        counts = np.bincount(group_codes, minlength=groups)
+        if function in ('sum', 'avg'):
+            totals = np.bincount(group_codes, weights=values, minlength=groups)
+            if function == 'sum':
+                results[alias] = totals
+                # As from Firestore, a sum of integers is an integer
+                fractional = np.fromiter((isinstance(value, float) for value in column), dtype=bool, count=size)
+                integral[alias] = np.bincount(codes[valid & fractional], minlength=groups) == 0
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    results[alias] = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+        elif function == 'min':
+            out = np.full(groups, np.inf)
+            np.minimum.at(out, group_codes, values)
+            results[alias] = np.where(counts > 0, out, np.nan)
+        elif function == 'max':
+            out = np.full(groups, -np.inf)
+            np.maximum.at(out, group_codes, values)
+            results[alias] = np.where(counts > 0, out, np.nan)
+        else:
+            raise ValueError("Unsupported aggregation: %s" % function)
+
+    rows = []
+    for code, key in enumerate(keys):
+        row = dict(zip(group_fields, key))
+        for alias, aggregation in aggregations.items():
+            value = results[alias][code]
+            if aggregation.function == 'count':
+                row[alias] = int(value)
+            elif alias in integral and integral[alias][code]:
+                row[alias] = int(value)
+            else:
+                row[alias] = None if np.isnan(value) else float(value)
+        rows.append(row)
+    return rows
+
+
 class FirestoreDocument:
     def __init__(self, data):
         for key, value in data.items():
             setattr(self, key, value)
 
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class FirestoreRow(tuple):
+    """Base of the compact row types made by row_class().
+
+    Like a namedtuple, a row is a tuple read through one itemgetter property
+    per field: the document id, the model's fields, and last ``_extra`` with
+    the fields a document has beyond the model's list (None when it has none).
+    """
+    __slots__ = ()
+    _fields = ()
+    _data_fields = ()
+    _field_set = frozenset()
+    _extra = property(itemgetter(-1))
+
+    @classmethod
+    def make(cls, doc_id, data):
+        """A row from a document's id and data"""
+        try:
+            values = cls._get_fields(data)
+            complete = len(data) == len(values)
+        except KeyError:
+            # A document without some of the model's fields
+            values = tuple(map(data.get, cls._data_fields))
+            complete = False
+        extra = None
+        # With exactly the model's fields a document has nothing else to keep
+        if not complete and not data.keys() <= cls._field_set:
+            extra = {key: value for key, value in data.items() if key not in cls._field_set}
+        return tuple.__new__(cls, (doc_id, *values, extra))
+
+    def __getattr__(self, name):
+        # Only reached when name is not one of the model's fields
+        extra = self[-1]
+        if extra and name in extra:
+            return extra[name]
+        raise AttributeError("%s has no field %r" % (type(self).__name__, name))
+
+    def to_dict(self):
+        data = dict(zip(self._fields, self))
+        if self[-1]:
+            data.update(self[-1])
+        return data
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, self.id)
+
+    def __reduce__(self):
+        # The per-model classes cannot be looked up by name, so rows pickle as their field list and data
+        return _rebuild_row, (self._fields, self.to_dict())
+
+
+_row_classes = {}
+
+
+def _tuple_getter(fields):
+    """itemgetter that returns a tuple whatever the number of fields"""
+    if len(fields) == 1:
+        field = fields[0]
+        return lambda data: (data[field],)
+    if not fields:
+        return lambda data: ()
+    return itemgetter(*fields)
+
+
+def row_class(fields):
+    """The FirestoreRow subclass for a field list, built once per distinct list.
+
+    Against a FirestoreDocument a row is built faster, with no per-field
+    setattr() and no __dict__, and takes less memory.
+    """
+    fields = tuple(dict.fromkeys(('id',) + tuple(field for field in fields if field.isidentifier())))
+    cls = _row_classes.get(fields)
+    if cls is None:
+        namespace = {field: property(itemgetter(index)) for index, field in enumerate(fields)}
+        namespace.update(__slots__=(), _fields=fields, _data_fields=fields[1:], _field_set=frozenset(fields),
+                         _get_fields=staticmethod(_tuple_getter(fields[1:])))
+        cls = type('FirestoreRow_%d' % len(_row_classes), (FirestoreRow,), namespace)
+        _row_classes[fields] = cls
+    return cls
+
+
+def _in_thread(function, *args, **kwargs):
+    """Awaitable running a blocking call on a worker thread (not Django's single sync thread)"""
+    return sync_to_async(function, thread_sensitive=False)(*args, **kwargs)
+
+
+def _rebuild_row(fields, data):
+    return row_class(fields).make(data.get('id'), data)
+
+
+def commit_in_batches(db, operations, batch_size=MAX_BATCH_WRITES, concurrency=BULK_WRITE_CONCURRENCY):
+    """Apply (callable(batch)) operations through write batches committed concurrently.
+
+    At most ``concurrency`` commits are in flight, so memory stays bounded
+    while network round-trips overlap. Returns the number of batches committed.
+    """
+    committed = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = []
+        batch = db.batch()
+        size = 0
+        for operation in operations:
+            operation(batch)
+            size += 1
+            if size == batch_size:
+                pending.append(pool.submit(batch.commit))
+                batch = db.batch()
+                size = 0
+                if len(pending) >= concurrency:
+                    pending.pop(0).result()
+                    committed += 1
+        if size:
+            pending.append(pool.submit(batch.commit))
+        for future in pending:
+            future.result()
+            committed += 1
+    return committed
+
+
 # Custom model manager for Firestore
 class FirestoreManager:
-    def __init__(self, collection_name):
+    def __init__(self, collection_name, db=None, buffer_size=None, flush_interval=None, counters=(),
+                 counter_shards=COUNTER_SHARDS, cache=True, fields=None):
         self.collection_name = collection_name
-        self.client = FirestoreClient()
-        self.db = self.client.get_db()
+        # Documents are read into compact rows of the model's fields when they are given
+        self.row_class = row_class(fields) if fields else None
+        # Serve repeated reads from query_cache; off for collections polled for changes from other processes
+        self.cache = cache
+        # Resolved on first access, so defining a model does not connect to Firestore
+        self._db = _UNRESOLVED if db is None else db
+        # Fields whose per-value document counts are maintained on every create
+        self.counters = tuple(counters)
+        self.counter_shards = counter_shards
+        # Buffered create(): writes are queued and flushed by size or age
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._flush_timer = None
+        atexit.register(self.flush)
+
+    @property
+    def db(self):
+        if self._db is _UNRESOLVED:
+            self._db = FirestoreClient().get_db()
+        return self._db
+
+    def document(self, doc_id, data):
+        """Result object for one document's data"""
+        if self.row_class is not None:
+            return self.row_class.make(doc_id, data)
+        return FirestoreDocument(dict(data, id=doc_id))
+
+    def _new_document(self, kwargs):
+        kwargs['id'] = str(uuid.uuid4())
+        return kwargs
 
     def create(self, **kwargs):
         if self.db is None:
-            return FirestoreDocument(kwargs)
-            
-        doc_id = str(uuid.uuid4())
-        kwargs['id'] = doc_id
-        doc_ref = self.db.collection(self.collection_name).document(doc_id)
-        doc_ref.set(kwargs)
-        return FirestoreDocument(kwargs)
+            return self.document(kwargs.get('id'), kwargs)
 
-    def all(self):
+        self._new_document(kwargs)
+        if self.buffer_size or self.flush_interval:
+            self._buffer_write(kwargs)
+            return self.document(kwargs['id'], kwargs)
+
+        doc_ref = self.db.collection(self.collection_name).document(kwargs['id'])
+        if self.counters:
+            # Document and counter increment commit together in one round-trip
+            batch = self.db.batch()
+            batch.set(doc_ref, kwargs)
+            self._increment_counters(batch, [kwargs])
+            batch.commit()
+        else:
+            doc_ref.set(kwargs)
+        self.invalidate_cache()
+        return self.document(kwargs['id'], kwargs)
+
+    def bulk_create(self, objs, batch_size=MAX_BATCH_WRITES):
+        """Create many documents with batched, pipelined commits instead of one set() each"""
+        docs = [self._new_document(dict(obj)) for obj in objs]
+        if self.db is not None and docs:
+            self._write_documents(docs, batch_size)
+            self.invalidate_cache()
+        return [self.document(data['id'], data) for data in docs]
+
+    def get_or_create(self, id, defaults=None):
+        """Create document ``id`` from defaults unless it exists; returns (document, created).
+
+        The write is a create-if-absent committed with the counter increments,
+        so concurrent duplicates store one document and are counted once.
+        """
+        from google.api_core.exceptions import AlreadyExists
+
+        data = dict(defaults or {}, id=id)
+        if self.db is None:
+            return self.document(id, data), True
+        batch = self.db.batch()
+        batch.create(self.db.collection(self.collection_name).document(id), data)
+        self._increment_counters(batch, [data])
+        try:
+            batch.commit()
+        except AlreadyExists:
+            return self.get_by_id(id), False
+        self.invalidate_cache()
+        return self.document(id, data), True
+
+    def _write_documents(self, docs, batch_size=MAX_BATCH_WRITES):
+        """Set documents through concurrent batch commits, each carrying its own documents' counter increments"""
+        collection = self.db.collection(self.collection_name)
+        per_batch = batch_size - len(self.counters)
+
+        def write(batch, chunk):
+            for data in chunk:
+                batch.set(collection.document(data['id']), data)
+            self._increment_counters(batch, chunk)
+        # One operation per batch, so a document and its increment always commit together
+        commit_in_batches(self.db, (
+            lambda batch, chunk=docs[start:start + per_batch]: write(batch, chunk)
+            for start in range(0, len(docs), per_batch)
+        ), batch_size=1)
+
+    def update(self, doc_id, **fields):
+        """Change some fields of one document without rewriting the others"""
+        if self.db is not None:
+            self.db.collection(self.collection_name).document(doc_id).update(fields)
+            self.invalidate_cache()
+
+    def invalidate_cache(self):
+        """Drop this collection's cached query results"""
+        query_cache.invalidate((id(self.db), self.collection_name))
+
+    def _counter_ref(self, field, shard):
+        return self.db.collection(COUNTER_COLLECTION).document(
+            '%s__%s__%d' % (self.collection_name, field, shard))
+
+    def _increment_counters(self, batch, docs):
+        from google.cloud.firestore_v1.transforms import Increment
+
+        for field in self.counters:
+            totals = Counter(str(doc[field]) for doc in docs if doc.get(field) is not None)
+            if not totals:
+                continue
+            # A random shard spreads concurrent increments over several documents
+            batch.set(self._counter_ref(field, random.randrange(self.counter_shards)), {
+                'collection': self.collection_name,
+                'field': field,
+                'counts': {value: Increment(n) for value, n in totals.items()},
+            }, merge=True)
+
+    def _counter_totals(self, field):
+        """Whether any counter shard of a field exists, and the per-value totals over its shards"""
+        snapshots = self.db.get_all([self._counter_ref(field, shard) for shard in range(self.counter_shards)])
+        totals = Counter()
+        found = False
+        for snapshot in snapshots:
+            if snapshot.exists:
+                found = True
+                totals.update((snapshot.to_dict() or {}).get('counts', {}))
+        return found, totals
+
+    def counter_values(self, field):
+        """Document count per value of a counted field, read from the counter shards"""
         if self.db is None:
-            return FirestoreQuerySet(self.collection_name, None)
-        return FirestoreQuerySet(self.collection_name, self.db)
+            return {}
+        found, totals = self._counter_totals(field)
+        if not found:
+            # Counters were never built (or were reset): count once from the collection
+            return self.rebuild_counters(field)
+        return dict(totals)
+
+    def rebuild_counters(self, field, attempts=COUNTER_REBUILD_ATTEMPTS):
+        """Recount a counted field from the collection and correct its counter shards; returns the counts.
+
+        For documents written without FirestoreManager (see the reconcile_counters
+        command). The correction is committed as increments rather than by
+        resetting the shards, so creates committed meanwhile keep theirs, and
+        the recount is retried when the shards moved while it ran.
+        """
+        from google.cloud.firestore_v1.transforms import Increment
+
+        # Uncached: a queryset without a manager always reads the collection
+        queryset = FirestoreQuerySet(self.collection_name, self.db)
+        for _ in range(attempts):
+            _, before = self._counter_totals(field)
+            counts = {str(row[field]): row['n'] for row in queryset.values(field).annotate(n=Count('id'))
+                      if row[field] is not None}
+            found, totals = self._counter_totals(field)
+            if totals == before:
+                break
+        else:
+            logger.warning("Counters of %s.%s kept changing during the recount; corrected against the last reading",
+                           self.collection_name, field)
+        delta = {value: counts.get(value, 0) - totals.get(value, 0) for value in set(counts) | set(totals)}
+        delta = {value: n for value, n in delta.items() if n}
+        if delta or not found:
+            batch = self.db.batch()
+            batch.set(self._counter_ref(field, 0), {
+                'collection': self.collection_name,
+                'field': field,
+                'counts': {value: Increment(n) for value, n in delta.items()},
+            }, merge=True)
+            batch.commit()
+        return counts
+
+    def reset_counters(self):
+        """Drop the counter shards; the next counter_values() call recounts"""
+        if self.db is None or not self.counters:
+            return
+        batch = self.db.batch()
+        for field in self.counters:
+            for shard in range(self.counter_shards):
+                batch.delete(self._counter_ref(field, shard))
+        batch.commit()
+
+    def _buffer_write(self, data):
+        with self._buffer_lock:
+            self._buffer.append(data)
+            full = self.buffer_size and len(self._buffer) >= self.buffer_size
+            if not full and self.flush_interval and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write out any buffered create() calls"""
+        with self._buffer_lock:
+            pending, self._buffer = self._buffer, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if pending and self.db is not None:
+            self._write_documents(pending)
+            self.invalidate_cache()
+        return len(pending)
+
+    @contextmanager
+    def buffered(self, buffer_size=MAX_BATCH_WRITES, flush_interval=1.0):
+        """Temporarily buffer create() calls, flushing everything on exit"""
+        previous = self.buffer_size, self.flush_interval
+        self.buffer_size, self.flush_interval = buffer_size, flush_interval
+        try:
+            yield self
+        finally:
+            self.buffer_size, self.flush_interval = previous
+            self.flush()
+
+    def all(self):
+        return FirestoreQuerySet(self.collection_name, self.db, self)
 
     def filter(self, *args, **kwargs):
         qs = self.all()
         return qs.filter(*args, **kwargs)
 
     def get(self, **kwargs):
-        return self.filter(**kwargs).get()
+        return self.all().get(**kwargs)
+
+    def get_by_id(self, doc_id):
+        return self.all().get_by_id(doc_id)
 
     def values(self, *fields):
         """For Django-style values() queries used in charts"""
         return self.all().values(*fields)
 
+    def count(self):
+        return self.all().count()
+
+    def only(self, *fields):
+        return self.all().only(*fields)
+
+    def order_by(self, *fields):
+        return self.all().order_by(*fields)
+
+    def iterator(self, chunk_size=500):
+        return self.all().iterator(chunk_size=chunk_size)
+
+    def values_list(self, *fields, flat=False):
+        return self.all().values_list(*fields, flat=flat)
+
+    def aggregate(self, **aggregations):
+        return self.all().aggregate(**aggregations)
+
     def delete_all(self):
         """Delete all documents in the collection"""
         return self.all().delete()
 
+    async def acreate(self, **kwargs):
+        return await _in_thread(self.create, **kwargs)
+
+    async def aget(self, **kwargs):
+        return await self.all().aget(**kwargs)
+
+    async def acount(self):
+        return await self.all().acount()
+
+    def aiter(self, chunk_size=500):
+        return self.all().aiter(chunk_size=chunk_size)
+
+    async def acounter_values(self, field):
+        return await _in_thread(self.counter_values, field)
+
 # Add Count and Avg functions for compatibility
-class Count:
+class Aggregate:
+    function = None
+
     def __init__(self, field):
         self.field = field
 
-class Avg:
-    def __init__(self, field):
-        self.field = field 
\ No newline at end of file
+class Count(Aggregate):
+    function = 'count'
+
+class Avg(Aggregate):
+    function = 'avg'
+
+class Sum(Aggregate):
+    function = 'sum'
+
+class Min(Aggregate):
+    function = 'min'
+
+class Max(Aggregate):
+    function = 'max'
+
+# Aggregations Firestore can evaluate server-side with an aggregation query;
+# Min and Max always run client-side through aggregate_columns()
+SERVER_AGGREGATES = ('count', 'sum', 'avg') 
+# Count() targets that count whole documents rather than a field's non-null values
+COUNT_ALL = ('id', '*')
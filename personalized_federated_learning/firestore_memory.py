@@ -0,0 +1,317 @@
+"""In-process stand-in for the subset of the Firestore client API used by firestore_backend.
+
+Selected with FIRESTORE_CONFIG['backend'] = 'memory' (or FIRESTORE_BACKEND=memory).
+Every network round-trip (document get/set/delete, query stream, batch commit)
+sleeps for ``latency`` seconds outside the lock, so concurrent requests overlap
+the way they do against the real service and write/read throughput can be
+benchmarked offline.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.transforms import Increment
+
+from storage_engine import StorageEngine
+
+MAX_BATCH_WRITES = 500
+DOCUMENT_ID = '__name__'
+# Sorted query results kept per collection, least recently used dropped first
+QUERY_CACHE_SIZE = 64
+
+
+def _matches(value, operator, expected):
+    if operator == '==':
+        return value == expected
+    if operator == '!=':
+        return value != expected
+    if operator == 'in':
+        return value in expected
+    if operator == 'not-in':
+        return value not in expected
+    if value is None:
+        return False
+    try:
+        if operator == '<':
+            return value < expected
+        if operator == '<=':
+            return value <= expected
+        if operator == '>':
+            return value > expected
+        if operator == '>=':
+            return value >= expected
+    except TypeError:
+        return False
+    raise ValueError("Unsupported operator: %s" % operator)
+
+
+def _rank(value):
+    """Sort key following Firestore's cross-type ordering (null < bool < number < string)"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    return (3, str(value))
+
+
+def _merge(existing, data):
+    """Firestore set(merge=True): maps merge recursively and Increment adds to the stored number"""
+    merged = dict(existing or {})
+    for key, value in data.items():
+        if isinstance(value, Increment):
+            current = merged.get(key)
+            merged[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict):
+            current = merged.get(key)
+            merged[key] = _merge(current if isinstance(current, dict) else {}, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class MemoryDocumentSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self._collection_name = collection_name
+        self.id = doc_id
+
+    def create(self, data):
+        batch = self._client.batch()
+        batch.create(self, data)
+        batch.commit()
+
+    def set(self, data, merge=False):
+        self._client._round_trip()
+        self._client._apply_set(self._collection_name, self.id, data, merge)
+
+    def update(self, data):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self._client._round_trip()
+        self._client._apply_delete(self._collection_name, self.id)
+
+    def get(self):
+        self._client._round_trip()
+        with self._client._lock:
+            data = self._client._collections.get(self._collection_name, {}).get(self.id)
+            return MemoryDocumentSnapshot(self.id, dict(data) if data is not None else None)
+
+
+class MemoryQuery:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, client, collection_name, filters=(), projection=None, orders=(), limit=None,
+                 start_after=None):
+        self._client = client
+        self._collection_name = collection_name
+        self._filters = tuple(filters)
+        self._projection = projection
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, projection=self._projection, orders=self._orders,
+                     limit=self._limit, start_after=self._start_after)
+        state.update(changes)
+        return MemoryQuery(self._client, self._collection_name, **state)
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields):
+        if isinstance(document_fields, MemoryDocumentSnapshot):
+            document_fields = dict(document_fields.to_dict(), **{DOCUMENT_ID: document_fields.id})
+        return self._copy(start_after=document_fields)
+
+    def _order_values(self, doc_id, data):
+        return [doc_id if field == DOCUMENT_ID else data.get(field) for field, _ in self._orders]
+
+    def _compare(self, left, right):
+        for (_, direction), a, b in zip(self._orders, left, right):
+            a, b = _rank(a), _rank(b)
+            if a != b:
+                result = -1 if a < b else 1
+                return -result if direction == self.DESCENDING else result
+        return 0
+
+    def where(self, field, operator, value):
+        return self._copy(filters=self._filters + ((field, operator, value),))
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def _matching_documents(self):
+        """Filtered and ordered (doc_id, data) pairs, cached until the collection changes"""
+        client = self._client
+        cache_key = (repr(self._filters), self._orders)
+        with client._lock:
+            version = client._versions.get(self._collection_name, 0)
+            results = client._query_cache.setdefault(self._collection_name, OrderedDict())
+            cached = results.get(cache_key)
+            if cached is not None and cached[0] == version:
+                results.move_to_end(cache_key)
+                return cached[1]
+            docs = list(client._collections.get(self._collection_name, {}).items())
+        docs = [(doc_id, data) for doc_id, data in docs
+                if all(_matches(data.get(field), operator, value) for field, operator, value in self._filters)]
+        if self._orders:
+            # Like Firestore, documents without an ordered field are left out
+            docs = [(doc_id, data) for doc_id, data in docs
+                    if all(field == DOCUMENT_ID or field in data for field, _ in self._orders)]
+            keys = {doc_id: [_rank(value) for value in self._order_values(doc_id, data)] for doc_id, data in docs}
+            # Stable sorts from the last key to the first give each key its own direction
+            for index in reversed(range(len(self._orders))):
+                docs.sort(key=lambda doc: keys[doc[0]][index], reverse=self._orders[index][1] == self.DESCENDING)
+        with client._lock:
+            # The version guards against a write that landed while this query ran
+            results = client._query_cache.setdefault(self._collection_name, OrderedDict())
+            results[cache_key] = (version, docs)
+            results.move_to_end(cache_key)
+            while len(results) > QUERY_CACHE_SIZE:
+                results.popitem(last=False)
+        return docs
+
+    def _snapshots(self):
+        docs = self._matching_documents()
+        if self._start_after is not None:
+            cursor = [self._start_after.get(field) for field, _ in self._orders]
+            low, high = 0, len(docs)
+            while low < high:
+                middle = (low + high) // 2
+                if self._compare(self._order_values(*docs[middle]), cursor) > 0:
+                    high = middle
+                else:
+                    low = middle + 1
+            docs = docs[low:]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for doc_id, data in docs:
+            if self._projection is not None:
+                data = {field: data[field] for field in self._projection if field in data}
+            yield MemoryDocumentSnapshot(doc_id, dict(data))
+
+    def stream(self):
+        self._client._round_trip()
+        return iter(list(self._snapshots()))
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, collection_name):
+        super().__init__(client, collection_name)
+
+    @property
+    def id(self):
+        return self._collection_name
+
+    def document(self, doc_id=None):
+        return MemoryDocumentReference(self._client, self._collection_name, doc_id or uuid.uuid4().hex)
+
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def create(self, reference, data):
+        self._ops.append(('create', reference, data, False))
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(('set', reference, data, True))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, False))
+
+    def commit(self):
+        if len(self._ops) > MAX_BATCH_WRITES:
+            raise ValueError("A write batch can contain at most %d operations" % MAX_BATCH_WRITES)
+        self._client._round_trip()
+        with self._client._lock:
+            # Like Firestore, a create of an existing document fails the whole batch
+            for op, reference, data, merge in self._ops:
+                if op == 'create' and reference.id in self._client._collections.get(reference._collection_name, {}):
+                    raise AlreadyExists("Document already exists: %s/%s" % (reference._collection_name, reference.id))
+            for op, reference, data, merge in self._ops:
+                if op in ('set', 'create'):
+                    self._client._apply_set(reference._collection_name, reference.id, data, merge)
+                else:
+                    self._client._apply_delete(reference._collection_name, reference.id)
+        self._ops = []
+
+
+class InMemoryFirestore(StorageEngine):
+    """Thread-safe dict-of-dicts database exposing the Firestore client calls we rely on"""
+    name = 'memory'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._collections = {}
+        # Bumped on every write; lets queries reuse their sorted results until the data changes
+        self._versions = {}
+        # collection -> LRU of (filters, orders) -> (version, sorted documents); emptied by writes
+        self._query_cache = {}
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _apply_set(self, collection_name, doc_id, data, merge):
+        with self._lock:
+            self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+            self._query_cache.pop(collection_name, None)
+            docs = self._collections.setdefault(collection_name, {})
+            docs[doc_id] = _merge(docs.get(doc_id) if merge else None, data)
+
+    def _apply_delete(self, collection_name, doc_id):
+        with self._lock:
+            self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+            self._query_cache.pop(collection_name, None)
+            self._collections.get(collection_name, {}).pop(doc_id, None)
+
+    def collection(self, name):
+        return MemoryCollectionReference(self, name)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def get_all(self, references):
+        """Read several documents in a single round-trip"""
+        self._round_trip()
+        snapshots = []
+        with self._lock:
+            for reference in references:
+                data = self._collections.get(reference._collection_name, {}).get(reference.id)
+                snapshots.append(MemoryDocumentSnapshot(reference.id, dict(data) if data is not None else None))
+        return iter(snapshots)
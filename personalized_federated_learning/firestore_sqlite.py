@@ -0,0 +1,424 @@
+"""SQLite engine for the subset of the Firestore client API used by firestore_backend.
+
+Selected with FIRESTORE_CONFIG['backend'] = 'sqlite' (or FIRESTORE_BACKEND=sqlite).
+Documents are stored as JSON in one table keyed by (collection, id), and
+filters, ordering, cursors and count/sum/avg aggregations are translated to
+SQL on json_extract() of the fields. Like Firestore's automatic single-field
+indexes, an expression index is created the first time a field is filtered
+or ordered on; the composite indexes of firestore.indexes.json are created
+when the database is opened.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from google.api_core.exceptions import AlreadyExists
+
+from firestore_memory import DOCUMENT_ID, MAX_BATCH_WRITES, MemoryDocumentSnapshot, _merge
+from storage_engine import StorageEngine
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+) WITHOUT ROWID
+'''
+RANGE_OPERATORS = ('<', '<=', '>', '>=')
+# Rows sampled per index by ANALYZE, which keeps refreshing the planner statistics cheap
+ANALYSIS_LIMIT = 1000
+# Writes before the first statistics refresh; the interval doubles after each one
+ANALYZE_AFTER_WRITES = 1000
+NUMBER_TYPES = "('integer', 'real')"
+
+
+def _path(field):
+    if '"' in field or "'" in field:
+        raise ValueError("Unsupported field name: %s" % field)
+    return "'$.\"%s\"'" % field
+
+
+def _column(field):
+    """SQL for a field's value; indexes and queries must spell it the same way to match"""
+    if field == DOCUMENT_ID:
+        return 'id'
+    return 'json_extract(data, %s)' % _path(field)
+
+
+def _type(field):
+    return 'json_type(data, %s)' % _path(field)
+
+
+def _json_default(value):
+    # numpy scalars coming from model predictions
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def _dumps(data):
+    try:
+        return json.dumps(data, default=_json_default, allow_nan=False)
+    except ValueError:
+        # SQLite's JSON functions reject the NaN and Infinity literals
+        raise ValueError("The sqlite backend cannot store NaN or infinite values")
+
+
+def _condition(field, operator, value):
+    """WHERE clause and parameters for one filter, with Firestore's type-aware comparisons"""
+    column = _column(field)
+    if operator in ('in', 'not-in'):
+        values = list(value)
+        sql = '%s %s (%s)' % (column, 'IN' if operator == 'in' else 'NOT IN', ', '.join('?' * len(values)))
+        return sql, values
+    if value is None:
+        if operator == '==':
+            return "%s = 'null'" % _type(field), []
+        if operator == '!=':
+            return "%s != 'null'" % _type(field), []
+        return '0', []
+    if operator == '==':
+        return '%s = ?' % column, [value]
+    if operator == '!=':
+        return '%s != ?' % column, [value]
+    if operator not in RANGE_OPERATORS:
+        raise ValueError("Unsupported operator: %s" % operator)
+    sql = '%s %s ?' % (column, operator)
+    # Range filters only match values of the same type, as in Firestore
+    if field != DOCUMENT_ID:
+        if isinstance(value, str):
+            sql += " AND %s = 'text'" % _type(field)
+        elif isinstance(value, (int, float)):
+            sql += ' AND %s IN %s' % (_type(field), NUMBER_TYPES)
+    return sql, [value]
+
+
+class SQLiteDocumentReference:
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self._collection_name = collection_name
+        self.id = doc_id
+
+    def create(self, data):
+        self._client._write([('create', self._collection_name, self.id, data, False)])
+
+    def set(self, data, merge=False):
+        self._client._write([('set', self._collection_name, self.id, data, merge)])
+
+    def update(self, data):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self._client._write([('delete', self._collection_name, self.id, None, False)])
+
+    def get(self):
+        return next(self._client.get_all([self]))
+
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class SQLiteAggregationQuery:
+    """count/sum/avg over a query, computed in one SELECT"""
+    def __init__(self, query, aggregations=()):
+        self._query = query
+        self._aggregations = tuple(aggregations)
+
+    def _add(self, function, field, alias):
+        alias = alias or 'field_%d' % (len(self._aggregations) + 1)
+        return SQLiteAggregationQuery(self._query, self._aggregations + ((function, field, alias),))
+
+    def count(self, alias=None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add('sum', field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add('avg', field_ref, alias)
+
+    def get(self):
+        columns = []
+        for function, field, _ in self._aggregations:
+            if function == 'count':
+                columns.append('COUNT(*)')
+                continue
+            # Like Firestore, only numeric values take part
+            value = 'CASE WHEN %s IN %s THEN %s END' % (_type(field), NUMBER_TYPES, _column(field))
+            columns.append('COALESCE(SUM(%s), 0)' % value if function == 'sum' else 'AVG(%s)' % value)
+        where, parameters = self._query._where()
+        row = self._query._client._fetch('SELECT %s FROM documents WHERE %s' % (', '.join(columns), where),
+                                         parameters)[0]
+        return [[AggregationResult(alias, value) for (_, _, alias), value in zip(self._aggregations, row)]]
+
+
+class SQLiteQuery:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, client, collection_name, filters=(), projection=None, orders=(), limit=None,
+                 start_after=None):
+        self._client = client
+        self._collection_name = collection_name
+        self._filters = tuple(filters)
+        self._projection = projection
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, projection=self._projection, orders=self._orders,
+                     limit=self._limit, start_after=self._start_after)
+        state.update(changes)
+        return SQLiteQuery(self._client, self._collection_name, **state)
+
+    def where(self, field, operator, value):
+        return self._copy(filters=self._filters + ((field, operator, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields):
+        if isinstance(document_fields, MemoryDocumentSnapshot):
+            document_fields = dict(document_fields.to_dict(), **{DOCUMENT_ID: document_fields.id})
+        return self._copy(start_after=document_fields)
+
+    def count(self, alias=None):
+        return SQLiteAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return SQLiteAggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return SQLiteAggregationQuery(self).avg(field_ref, alias)
+
+    def _cursor_condition(self):
+        """Rows strictly after the cursor in the query's ordering"""
+        alternatives, parameters = [], []
+        equal, equal_parameters = [], []
+        for field, direction in self._orders:
+            column = _column(field)
+            value = self._start_after.get(field)
+            after = '<' if direction == self.DESCENDING else '>'
+            if value is None:
+                # null sorts first, so everything non-null comes after it when ascending
+                step, step_parameters = ('%s IS NOT NULL' % column if after == '>' else '0'), []
+            elif after == '<':
+                # SQL NULL compares as unknown, but null sorts last when descending
+                step, step_parameters = '(%s < ? OR %s IS NULL)' % (column, column), [value]
+            else:
+                step, step_parameters = '%s > ?' % column, [value]
+            alternatives.append(' AND '.join(equal + [step]))
+            parameters += equal_parameters + step_parameters
+            equal = equal + ['%s IS ?' % column]
+            equal_parameters = equal_parameters + [value]
+        return '(%s)' % ' OR '.join('(%s)' % alternative for alternative in alternatives), parameters
+
+    def _where(self):
+        clauses, parameters = ['collection = ?'], [self._collection_name]
+        for field, operator, value in self._filters:
+            self._client._ensure_index(field)
+            sql, values = _condition(field, operator, value)
+            clauses.append(sql)
+            parameters += values
+        for field, _ in self._orders:
+            if field != DOCUMENT_ID:
+                self._client._ensure_index(field)
+                # Like Firestore, documents without an ordered field are left out
+                clauses.append('%s IS NOT NULL' % _type(field))
+        if self._start_after is not None and self._orders:
+            sql, values = self._cursor_condition()
+            clauses.append(sql)
+            parameters += values
+        return ' AND '.join(clauses), parameters
+
+    def stream(self):
+        keys_only = self._projection is not None and not [field for field in self._projection
+                                                          if field != DOCUMENT_ID]
+        where, parameters = self._where()
+        sql = 'SELECT id%s FROM documents WHERE %s' % ('' if keys_only else ', data', where)
+        if self._orders:
+            sql += ' ORDER BY ' + ', '.join('%s %s' % (_column(field), 'DESC' if direction == self.DESCENDING
+                                                       else 'ASC') for field, direction in self._orders)
+        if self._limit is not None:
+            sql += ' LIMIT %d' % self._limit
+        snapshots = []
+        for row in self._client._fetch(sql, parameters):
+            data = {} if keys_only else json.loads(row[1])
+            if self._projection is not None:
+                data = {field: data[field] for field in self._projection if field in data}
+            snapshots.append(MemoryDocumentSnapshot(row[0], data))
+        return iter(snapshots)
+
+
+class SQLiteCollectionReference(SQLiteQuery):
+    def __init__(self, client, collection_name):
+        super().__init__(client, collection_name)
+
+    @property
+    def id(self):
+        return self._collection_name
+
+    def document(self, doc_id=None):
+        return SQLiteDocumentReference(self._client, self._collection_name, doc_id or uuid.uuid4().hex)
+
+
+class SQLiteWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def __len__(self):
+        return len(self._ops)
+
+    def create(self, reference, data):
+        self._ops.append(('create', reference._collection_name, reference.id, data, False))
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference._collection_name, reference.id, data, merge))
+
+    def update(self, reference, data):
+        self.set(reference, data, merge=True)
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference._collection_name, reference.id, None, False))
+
+    def commit(self):
+        if len(self._ops) > MAX_BATCH_WRITES:
+            raise ValueError("A write batch can contain at most %d operations" % MAX_BATCH_WRITES)
+        self._client._write(self._ops)
+        self._ops = []
+
+
+class SQLiteFirestore(StorageEngine):
+    """Firestore-shaped document store in a single SQLite database (a file, or ':memory:')"""
+    name = 'sqlite'
+
+    def __init__(self, path=':memory:', indexes_file=None):
+        self.path = path
+        self.round_trips = 0
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection shared by all threads; SQLite calls are short and serialized by the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._indexed = set()
+        self._writes = 0
+        self._analyze_at = ANALYZE_AFTER_WRITES
+        with self._lock:
+            if path != ':memory:':
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('PRAGMA analysis_limit=%d' % ANALYSIS_LIMIT)
+            self._connection.execute(SCHEMA)
+        if indexes_file and os.path.exists(indexes_file):
+            self.create_indexes(indexes_file)
+
+    def analyze(self):
+        """Refresh the statistics the planner uses to choose between the key and the field indexes.
+
+        Without them SQLite always prefers the (collection, id) key, even for
+        an equality filter on an indexed field.
+        """
+        with self._lock:
+            self._connection.execute('ANALYZE documents')
+
+    def _fetch(self, sql, parameters=()):
+        with self._lock:
+            self.round_trips += 1
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _index(self, fields):
+        name = 'field_' + hashlib.sha1('\0'.join(fields).encode()).hexdigest()[:16]
+        with self._lock:
+            self._connection.execute('CREATE INDEX IF NOT EXISTS %s ON documents (collection, %s)' % (
+                name, ', '.join(_column(field) for field in fields)))
+        self.analyze()
+
+    def _ensure_index(self, field):
+        if field != DOCUMENT_ID and field not in self._indexed:
+            self._index([field])
+            self._indexed.add(field)
+
+    def create_indexes(self, indexes_file):
+        """Create the composite indexes declared in a firestore.indexes.json file"""
+        with open(indexes_file) as f:
+            definitions = json.load(f).get('indexes', [])
+        for definition in definitions:
+            self._index([field['fieldPath'] for field in definition.get('fields', [])])
+
+    def _write(self, ops):
+        with self._lock:
+            self.round_trips += 1
+            connection = self._connection
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                for op, collection_name, doc_id, data, merge in ops:
+                    if op == 'delete':
+                        connection.execute('DELETE FROM documents WHERE collection = ? AND id = ?',
+                                           (collection_name, doc_id))
+                        continue
+                    if op == 'create':
+                        try:
+                            connection.execute('INSERT INTO documents (collection, id, data) VALUES (?, ?, ?)',
+                                               (collection_name, doc_id, _dumps(_merge(None, data))))
+                        except sqlite3.IntegrityError:
+                            raise AlreadyExists("Document already exists: %s/%s" % (collection_name, doc_id))
+                        continue
+                    existing = None
+                    if merge:
+                        row = connection.execute('SELECT data FROM documents WHERE collection = ? AND id = ?',
+                                                 (collection_name, doc_id)).fetchone()
+                        existing = json.loads(row[0]) if row else None
+                    connection.execute('INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)',
+                                       (collection_name, doc_id, _dumps(_merge(existing, data))))
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            self._writes += len(ops)
+            if self._writes >= self._analyze_at:
+                self._analyze_at *= 2
+                self.analyze()
+
+    def collection(self, name):
+        return SQLiteCollectionReference(self, name)
+
+    def batch(self):
+        return SQLiteWriteBatch(self)
+
+    def get_all(self, references):
+        references = list(references)
+        found = {}
+        by_collection = {}
+        for reference in references:
+            by_collection.setdefault(reference._collection_name, []).append(reference.id)
+        with self._lock:
+            self.round_trips += 1
+            for collection_name, doc_ids in by_collection.items():
+                rows = self._connection.execute(
+                    'SELECT id, data FROM documents WHERE collection = ? AND id IN (%s)' % ', '.join(
+                        '?' * len(doc_ids)), [collection_name] + doc_ids).fetchall()
+                found.update(((collection_name, doc_id), data) for doc_id, data in rows)
+        snapshots = []
+        for reference in references:
+            data = found.get((reference._collection_name, reference.id))
+            snapshots.append(MemoryDocumentSnapshot(reference.id, json.loads(data) if data is not None else None))
+        return iter(snapshots)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,117 @@
+"""Incremental training on rows appended to Datasets.csv.
+
+A checkpoint keeps an SGD and a Naive Bayes model together with the byte
+offset of the last row they were trained on. Each update reads only the bytes
+after that offset, featurizes them with the stateless PatientFeatures and
+calls partial_fit, so the cost depends on the new rows alone. If the file was
+rewritten rather than appended to (it shrank, or the bytes just before the
+offset changed) the models are rebuilt from the start.
+"""
+import hashlib
+import io
+import os
+import time
+import uuid
+
+import joblib
+import numpy as np
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+
+from dataset import dataset_path, label_results, read_csv
+from features import PatientFeatures
+from model_registry import registry
+
+CHECKPOINT_FILE = 'incremental.joblib'
+CLASSES = np.array([0, 1])
+# Bytes before the checkpoint offset that must be unchanged for the checkpoint to stay valid
+TAIL_BYTES = 4096
+INCREMENTAL_MODELS = ('sgd', 'nb')
+
+
+def checkpoint_path():
+    return os.path.join(registry.root, CHECKPOINT_FILE)
+
+
+def _tail_hash(f, offset):
+    start = max(0, offset - TAIL_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def _new_checkpoint(header):
+    return {
+        'header': header,
+        'offset': len(header),
+        'tail_sha1': None,
+        'rows': 0,
+        'sgd': SGDClassifier(loss='hinge', penalty='l2', random_state=0),
+        'nb': MultinomialNB(),
+    }
+
+
+def load_checkpoint():
+    try:
+        return joblib.load(checkpoint_path())
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(checkpoint):
+    os.makedirs(registry.root, exist_ok=True)
+    tmp_path = '%s.%s.tmp' % (checkpoint_path(), uuid.uuid4().hex)
+    joblib.dump(checkpoint, tmp_path)
+    os.replace(tmp_path, checkpoint_path())
+
+
+def _read_new_rows(path, checkpoint):
+    """New complete lines after the checkpoint, or the whole file if it was rewritten"""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        size = os.fstat(f.fileno()).st_size
+        rebuilt = (checkpoint is None or header != checkpoint['header'] or size < checkpoint['offset']
+                   or (checkpoint['tail_sha1'] is not None
+                       and _tail_hash(f, checkpoint['offset']) != checkpoint['tail_sha1']))
+        if rebuilt:
+            checkpoint = _new_checkpoint(header)
+        f.seek(checkpoint['offset'])
+        data = f.read()
+    # A row still being written has no newline yet; leave it for the next update
+    data = data[:data.rfind(b'\n') + 1]
+    return checkpoint, data, rebuilt
+
+
+def update_incremental(path=None, serve='sgd', publish=True):
+    """Train the checkpointed models on rows added since the last call and publish one of them"""
+    start = time.perf_counter()
+    path = path or dataset_path()
+    checkpoint, data, rebuilt = _read_new_rows(path, load_checkpoint())
+    report = {'rebuilt': rebuilt, 'new_rows': 0, 'accuracy_before_update': None, 'version': None}
+
+    if data.strip():
+        df = read_csv(io.BytesIO(checkpoint['header'] + data))
+        df['results'] = label_results(df['Label'])
+        df = df[df['results'].notna()]
+        X = PatientFeatures().transform(df)
+        y = df['results'].to_numpy(dtype=np.int64)
+        if len(y):
+            if checkpoint['rows']:
+                # Progressive validation: score the new rows before learning from them
+                report['accuracy_before_update'] = float((checkpoint[serve].predict(X) == y).mean()) * 100
+            for name in INCREMENTAL_MODELS:
+                checkpoint[name].partial_fit(X, y, classes=CLASSES)
+            checkpoint['rows'] += len(y)
+            report['new_rows'] = len(y)
+
+    checkpoint['offset'] += len(data)
+    with open(path, 'rb') as f:
+        checkpoint['tail_sha1'] = _tail_hash(f, checkpoint['offset'])
+    _save_checkpoint(checkpoint)
+
+    if publish and report['new_rows']:
+        report['version'] = registry.publish(PatientFeatures(), checkpoint[serve], feature_column=None,
+                                             incremental=True, trained_rows=checkpoint['rows'],
+                                             accuracy=report['accuracy_before_update'])
+    report['total_rows'] = checkpoint['rows']
+    report['seconds'] = time.perf_counter() - start
+    return report
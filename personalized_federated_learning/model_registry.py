@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import joblib
+import numpy as np
+from django.conf import settings
+
+LABELS = np.array(['Good', 'Bad'])
+ARTIFACT_FILE = 'artifact.joblib'
+MANIFEST_FILE = 'manifest.json'
+LATEST_FILE = 'LATEST'
+
+
+class ModelArtifact:
+    """A published vectorizer + classifier pair, ready for scoring"""
+    def __init__(self, vectorizer, classifier, version=None, metadata=None, feature_column='Fid'):
+        self.vectorizer = vectorizer
+        self.classifier = classifier
+        self.version = version
+        self.metadata = metadata or {}
+        # Column fed to the vectorizer; None means the vectorizer takes the whole frame
+        self.feature_column = feature_column
+
+    def transform(self, frame):
+        if self.feature_column is None:
+            return self.vectorizer.transform(frame)
+        return self.vectorizer.transform(frame[self.feature_column].astype(str))
+
+    def predict_codes(self, frame):
+        return np.asarray(self.classifier.predict(self.transform(frame)), dtype=np.intp)
+
+    def predict(self, frame):
+        """Return the Good/Bad label for every row of frame"""
+        return LABELS[self.predict_codes(frame)]
+
+
+class ModelRegistry:
+    """Versioned on-disk store of ModelArtifacts.
+
+    Every publish writes a new ``vNNNN`` directory and then atomically points
+    ``LATEST`` at it. ``get()`` keeps the loaded artifact for the lifetime of
+    the process and only re-reads it when ``LATEST`` changes on disk, so a
+    retrain in one worker is picked up by all the others without a restart.
+    """
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._artifact = None
+        self._latest_mtime = None
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith('v') and name[1:].isdigit())
+
+    def latest_version(self):
+        try:
+            with open(self._path(LATEST_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, vectorizer, classifier, feature_column='Fid', **metadata):
+        """Store a fitted model as a new version and make it the active one"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = self._path('.tmp-%s' % uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        metadata['published_at'] = time.time()
+        artifact = ModelArtifact(vectorizer, classifier, metadata=metadata, feature_column=feature_column)
+        joblib.dump(artifact, os.path.join(tmp_dir, ARTIFACT_FILE))
+
+        # Claim the next version number; rename fails if another worker won the race
+        while True:
+            existing = self.versions()
+            number = int(existing[-1][1:]) + 1 if existing else 1
+            version = 'v%04d' % number
+            try:
+                os.rename(tmp_dir, self._path(version))
+                break
+            except OSError:
+                if not os.path.exists(self._path(version)):
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    raise
+
+        with open(self._path(version, MANIFEST_FILE), 'w') as f:
+            json.dump(dict(metadata, version=version), f, indent=2, default=str)
+        self.activate(version)
+        artifact.version = version
+        return version
+
+    def activate(self, version):
+        """Point LATEST at an already published version (also used for rollback)"""
+        if not os.path.exists(self._path(version, ARTIFACT_FILE)):
+            raise ValueError("Unknown model version: %s" % version)
+        tmp_path = self._path('.%s.%s' % (LATEST_FILE, uuid.uuid4().hex))
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, self._path(LATEST_FILE))
+
+    def load(self, version):
+        artifact = joblib.load(self._path(version, ARTIFACT_FILE))
+        artifact.version = version
+        return artifact
+
+    def get(self):
+        """Return the active artifact, reloading it only if LATEST has moved"""
+        try:
+            mtime = os.stat(self._path(LATEST_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return self._artifact
+        if mtime == self._latest_mtime:
+            return self._artifact
+
+        with self._lock:
+            if mtime != self._latest_mtime:
+                version = self.latest_version()
+                if version and (self._artifact is None or self._artifact.version != version):
+                    self._artifact = self.load(version)
+                    print("Loaded model %s" % version)
+                self._latest_mtime = mtime
+        return self._artifact
+
+    def reload(self):
+        """Force the next get() to re-read LATEST"""
+        with self._lock:
+            self._latest_mtime = None
+        return self.get()
+
+
+registry = ModelRegistry(getattr(settings, 'MODEL_REGISTRY_DIR', os.path.join(settings.BASE_DIR, 'model_registry')))
@@ -80,6 +80,19 @@ DATABASES = {
 FIRESTORE_CONFIG = {
     'credentials_path': os.path.join(BASE_DIR, 'serviceAccountKey.json'),
     'project_id': os.getenv('FIREBASE_PROJECT_ID', 'your-project-id'),
+    # 'firestore' talks to Firestore (or to the emulator when FIRESTORE_EMULATOR_HOST is set),
+    # 'memory' uses the in-process stand-in from firestore_memory.py and
+    # 'sqlite' the local database engine from firestore_sqlite.py
+    'backend': os.getenv('FIRESTORE_BACKEND', 'firestore'),
+    # Backend used instead when the configured one cannot be initialized ('' to run without a database)
+    'fallback': os.getenv('FIRESTORE_FALLBACK', ''),
+    # Database file of the 'sqlite' backend (':memory:' for a throwaway one)
+    'sqlite_path': os.getenv('FIRESTORE_SQLITE_PATH', os.path.join(BASE_DIR, 'firestore.sqlite3')),
+    # Simulated round-trip time in seconds for the 'memory' backend
+    'memory_latency': float(os.getenv('FIRESTORE_MEMORY_LATENCY', '0')),
+    # Per-process query result cache: max entries and seconds to live (0 disables it)
+    'cache_size': int(os.getenv('FIRESTORE_CACHE_SIZE', '256')),
+    'cache_ttl': float(os.getenv('FIRESTORE_CACHE_TTL', '30')),
 }
 
 # Password validation
@@ -126,3 +139,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'Template/media')
 STATIC_ROOT = '/static/'
 
 STATIC_URL = '/static/'
+
+# Versioned store of the fitted prediction models published by train_model
+MODEL_REGISTRY_DIR = os.path.join(BASE_DIR, 'model_registry')
+
+# Single-patient predictions remembered per process for the active model (0 disables the cache)
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '4096'))
+
+# Typed columnar copies of Datasets.csv, rebuilt whenever the CSV changes
+DATASET_CACHE_DIR = os.path.join(BASE_DIR, 'dataset_cache')
@@ -27,6 +27,7 @@ urlpatterns = [
     url(r'^login/$', remoteuser.login, name="login"),
     url(r'^Register1/$', remoteuser.Register1, name="Register1"),
     url(r'^Predict_Hospital_Morality_Prediction/$', remoteuser.Predict_Hospital_Morality_Prediction, name="Predict_Hospital_Morality_Prediction"),
+    url(r'^Predict_Hospital_Morality_Prediction_Batch/$', remoteuser.Predict_Hospital_Morality_Prediction_Batch, name="Predict_Hospital_Morality_Prediction_Batch"),
     url(r'^ViewYourProfile/$', remoteuser.ViewYourProfile, name="ViewYourProfile"),
     url(r'^serviceproviderlogin/$',serviceprovider.serviceproviderlogin, name="serviceproviderlogin"),
     url(r'View_Remote_Users/$',serviceprovider.View_Remote_Users,name="View_Remote_Users"),
@@ -35,6 +36,7 @@ urlpatterns = [
     url(r'^likeschart/(?P<like_chart>\w+)', serviceprovider.likeschart, name="likeschart"),
     url(r'^View_All_Predicted_Hospital_Morality_Prediction_Ratio/$', serviceprovider.View_All_Predicted_Hospital_Morality_Prediction_Ratio, name="View_All_Predicted_Hospital_Morality_Prediction_Ratio"),
     url(r'^train_model/$', serviceprovider.train_model, name="train_model"),
+    url(r'^train_model_status/(?P<job_id>[\w-]+)/$', serviceprovider.train_model_status, name="train_model_status"),
     url(r'^View_All_Predicted_Hospital_Morality_Prediction/$', serviceprovider.View_All_Predicted_Hospital_Morality_Prediction, name="View_All_Predicted_Hospital_Morality_Prediction"),
     url(r'^Download_Predicted_DataSets/$', serviceprovider.Download_Predicted_DataSets, name="Download_Predicted_DataSets"),
 
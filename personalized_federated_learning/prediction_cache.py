@@ -0,0 +1,74 @@
+"""Memoized single-patient predictions.
+
+The prediction form is often resubmitted unchanged (retries, edits that
+change nothing, double clicks). Results are kept in a process-local LRU
+keyed by a hash of the normalized input fields; every entry belongs to the
+model version that produced it, and the whole cache is dropped as soon as
+a different version is active.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+def normalize_inputs(values, fields):
+    """The fields' values as stripped strings, missing ones as ''"""
+    return {field: '' if values.get(field) is None else str(values.get(field)).strip() for field in fields}
+
+
+def prediction_key(values, fields):
+    """SHA-1 of the normalized fields, in field order"""
+    normalized = normalize_inputs(values, fields)
+    return hashlib.sha1('\x1f'.join(normalized[field] for field in fields).encode('utf-8')).hexdigest()
+
+
+class PredictionCache:
+    """LRU of prediction results for the active model version"""
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, version, key):
+        """The cached prediction, or None"""
+        with self._lock:
+            if version == self.version and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, version, key, prediction):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                # A new (or rolled back) model: earlier results may no longer hold
+                self._entries.clear()
+                self.version = version
+                self.invalidations += 1
+            self._entries[key] = prediction
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'version': self.version, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+prediction_cache = PredictionCache(max_entries=getattr(settings, 'PREDICTION_CACHE_SIZE', 4096))
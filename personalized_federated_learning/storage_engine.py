@@ -0,0 +1,45 @@
+"""The database interface beneath FirestoreManager and FirestoreQuerySet.
+
+FirestoreManager talks to its database through the subset of the
+google.cloud.firestore Client API listed on StorageEngine, so the Firestore
+client itself is an engine as it is. firestore_memory and firestore_sqlite
+implement the same calls in-process. Which engine a process uses is set by
+FIRESTORE_CONFIG['backend'] (see firestore_backend.STORAGE_ENGINES).
+
+Besides the methods below an engine provides:
+
+- collection references: ``id``, ``document(doc_id=None)`` and the query
+  methods ``where(field, operator, value)``, ``order_by(field, direction)``,
+  ``select(fields)``, ``start_after(values)``, ``limit(count)`` and ``stream()``
+- document references: ``id``, ``get()``, ``create(data)``,
+  ``set(data, merge=False)``, ``update(data)`` and ``delete()``
+- snapshots: ``id``, ``exists`` and ``to_dict()``
+- write batches: ``create``, ``set``, ``update``, ``delete``, ``commit()``
+  and ``len()``; a create of an existing document makes the whole commit
+  raise google.api_core.exceptions.AlreadyExists
+
+Queries may also offer ``count(alias)``, ``sum(field, alias)`` and
+``avg(field, alias)`` aggregation queries; without them FirestoreQuerySet
+aggregates the streamed rows itself.
+"""
+from abc import ABC, abstractmethod
+
+
+class StorageEngine(ABC):
+    """Base class for the in-process engines; the Firestore client is duck-typed"""
+    name = None
+
+    @abstractmethod
+    def collection(self, name):
+        """Reference to a collection, which is also the query over all its documents"""
+
+    @abstractmethod
+    def batch(self):
+        """A new write batch"""
+
+    @abstractmethod
+    def get_all(self, references):
+        """Snapshots for several document references, read in a single round-trip"""
+
+    def close(self):
+        pass
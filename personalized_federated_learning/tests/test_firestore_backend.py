@@ -0,0 +1,94 @@
+import pickle
+import timeit
+import tracemalloc
+
+from django.test import SimpleTestCase
+
+from Remote_User.models import mortality_prediction
+from firestore_backend import Avg, Count, FirestoreDocument, FirestoreManager, Sum, row_class
+from firestore_memory import InMemoryFirestore
+from firestore_sqlite import SQLiteFirestore
+
+ENGINES = [('memory', InMemoryFirestore), ('sqlite', SQLiteFirestore)]
+
+
+class GetOrCreateTests(SimpleTestCase):
+    def test_get_or_create(self):
+        for name, engine in ENGINES:
+            with self.subTest(engine=name):
+                db = engine()
+                db.collection('predictions').document('existing').set({'Prediction': 'Good'})
+                manager = FirestoreManager('predictions', db=db, cache=False, counters=('Prediction',))
+                row, created = manager.get_or_create(id='existing', defaults={'Prediction': 'Bad'})
+                self.assertFalse(created)
+                self.assertEqual(row.Prediction, 'Good')
+                for _ in range(2):
+                    row, created = manager.get_or_create(id='new', defaults={'Prediction': 'Bad'})
+                self.assertFalse(created)
+                self.assertEqual(manager.get_by_id('new').Prediction, 'Bad')
+                # The repeated create stored one document and counted it once
+                self.assertEqual(manager.counter_values('Prediction')['Bad'], 1)
+                db.close()
+
+
+class AggregateTests(SimpleTestCase):
+    DOCUMENTS = [
+        {'names': 'a', 'n': 1},
+        {'names': 'b', 'n': 2},
+        {'names': None, 'n': 4},
+        {'n': None},
+        {'names': 'c', 'n': 'x'},
+    ]
+
+    def _aggregate(self, engine, **aggregations):
+        db = engine()
+        manager = FirestoreManager('aggregates', db=db, cache=False)
+        manager.bulk_create(self.DOCUMENTS)
+        result = manager.aggregate(**aggregations)
+        db.close()
+        return result
+
+    def test_engines_agree(self):
+        aggregations = dict(names=Count('names'), documents=Count('id'), star=Count('*'), total=Sum('n'),
+                            mean=Avg('n'))
+        expected = {'names': 3, 'documents': 5, 'star': 5, 'total': 7, 'mean': 7 / 3}
+        for name, engine in ENGINES:
+            with self.subTest(engine=name):
+                result = self._aggregate(engine, **aggregations)
+                self.assertEqual(result, expected)
+                self.assertIsInstance(result['total'], int)
+                # Alone, Count(field) must not be answered by a document count on the server
+                self.assertEqual(self._aggregate(engine, names=Count('names')), {'names': 3})
+
+
+class RowTests(SimpleTestCase):
+    def setUp(self):
+        self.fields = mortality_prediction.FIELDS
+        self.data = {field: '%s value' % field for field in self.fields}
+        self.row_class = row_class(self.fields)
+
+    def test_fields(self):
+        row = self.row_class.make('doc', dict(self.data, Extra=1))
+        self.assertEqual((row.id, row.Prediction, row.Extra), ('doc', 'Prediction value', 1))
+        partial = self.row_class.make('doc', {'Fid': 'f', 'id': 'doc'})
+        self.assertEqual((partial.Fid, partial.Age), ('f', None))
+        self.assertEqual(partial.to_dict(), dict(dict.fromkeys(self.fields), Fid='f', id='doc'))
+        with self.assertRaises(AttributeError):
+            partial.Extra
+        self.assertEqual(pickle.loads(pickle.dumps(row)).to_dict(), row.to_dict())
+
+    def _measure(self, make, count=20000):
+        seconds = min(timeit.repeat(lambda: make('doc', self.data), number=count, repeat=5))
+        tracemalloc.start()
+        rows = [make('doc%d' % i, self.data) for i in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del rows
+        return seconds, size
+
+    def test_rows_are_faster_and_smaller_than_documents(self):
+        row_seconds, row_size = self._measure(self.row_class.make)
+        document_seconds, document_size = self._measure(
+            lambda doc_id, data: FirestoreDocument(dict(data, id=doc_id)))
+        self.assertLess(row_seconds, document_seconds)
+        self.assertLess(row_size, document_size)
@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase
+from google.api_core.exceptions import AlreadyExists
+
+from firestore_backend import FirestoreManager
+from firestore_sqlite import SQLiteFirestore
+
+# Documents with one value of each type Firestore orders differently; 'f' has no score at all
+MIXED_SCORES = {'a': 'b', 'b': 10, 'c': None, 'd': 1.5, 'e': 'B', 'g': 3, 'h': 3}
+# Firestore's order: null < numbers < strings, ties broken by document id
+MIXED_ASCENDING = ['c', 'd', 'g', 'h', 'b', 'e', 'a']
+
+
+class SQLiteCursorTests(SimpleTestCase):
+    def setUp(self):
+        self.db = SQLiteFirestore(':memory:')
+        self.manager = FirestoreManager('scores', db=self.db, cache=False)
+
+    def tearDown(self):
+        self.db.close()
+
+    def _add(self, scores):
+        batch = self.db.batch()
+        collection = self.db.collection('scores')
+        for doc_id, score in scores.items():
+            batch.set(collection.document(doc_id), {'score': score})
+        batch.commit()
+
+    def _ids(self, queryset, chunk_size=2):
+        return [row.id for row in queryset.iterator(chunk_size=chunk_size)]
+
+    def test_descending_pages(self):
+        self._add({'doc%02d' % i: i % 4 for i in range(12)})
+        expected = sorted(('doc%02d' % i for i in range(12)), key=lambda doc_id: (-(int(doc_id[3:]) % 4), doc_id))
+        for chunk_size in (1, 3, 5, 100):
+            self.assertEqual(self._ids(self.manager.all().order_by('-score'), chunk_size), expected)
+
+    def test_mixed_type_pages(self):
+        self._add(MIXED_SCORES)
+        self.db.collection('scores').document('f').set({'other': 1})
+        self.assertEqual(self._ids(self.manager.all().order_by('score')), MIXED_ASCENDING)
+        # Equal scores stay in ascending id order under a descending sort
+        self.assertEqual(self._ids(self.manager.all().order_by('-score')), ['a', 'e', 'b', 'g', 'h', 'd', 'c'])
+
+    def test_start_after_document(self):
+        self._add(MIXED_SCORES)
+        for position, doc_id in enumerate(MIXED_ASCENDING):
+            rest = [row.id for row in self.manager.all().order_by('score').start_after(doc_id)]
+            self.assertEqual(rest, MIXED_ASCENDING[position + 1:])
+
+    def test_range_filter_matches_one_type(self):
+        self._add(MIXED_SCORES)
+        ids = [snapshot.id for snapshot in self.db.collection('scores').where('score', '>', 2).stream()]
+        self.assertEqual(sorted(ids), ['b', 'g', 'h'])
+
+
+class SQLiteCreateTests(SimpleTestCase):
+    def setUp(self):
+        self.db = SQLiteFirestore(':memory:')
+        self.collection = self.db.collection('predictions')
+        self.collection.document('existing').set({'Prediction': 'Good'})
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_batch_create_of_existing_document_fails_whole_commit(self):
+        batch = self.db.batch()
+        batch.create(self.collection.document('new'), {'Prediction': 'Bad'})
+        batch.create(self.collection.document('existing'), {'Prediction': 'Bad'})
+        with self.assertRaises(AlreadyExists):
+            batch.commit()
+        self.assertFalse(self.collection.document('new').get().exists)
+        self.assertEqual(self.collection.document('existing').get().to_dict(), {'Prediction': 'Good'})
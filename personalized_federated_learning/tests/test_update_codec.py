@@ -0,0 +1,44 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from update_codec import RawCodec, UpdateCodec, codec_from_spec
+
+
+class UpdateCodecTests(SimpleTestCase):
+    def setUp(self):
+        self.vector = np.random.default_rng(0).normal(size=1000)
+
+    def test_raw_round_trip(self):
+        codec = RawCodec()
+        np.testing.assert_array_equal(codec.decode(codec.encode(self.vector)), self.vector)
+
+    def test_dense_round_trips(self):
+        decoded = UpdateCodec(quantize=False).decode(UpdateCodec(quantize=False).encode(self.vector))
+        np.testing.assert_allclose(decoded, self.vector, rtol=1e-6)
+        codec = UpdateCodec()
+        decoded = codec.decode(codec.encode(self.vector))
+        # int8 steps are peak / 127, so no entry is off by more than half a step
+        self.assertLessEqual(np.abs(decoded - self.vector).max(), np.abs(self.vector).max() / 127 / 2 + 1e-12)
+
+    def test_top_k_keeps_largest_entries(self):
+        for spec, count in (('top0.01+float32', 10), ('top25', 25)):
+            codec = codec_from_spec(spec)
+            decoded = codec.decode(codec.encode(self.vector))
+            largest = np.argsort(np.abs(self.vector))[-count:]
+            self.assertEqual(set(np.flatnonzero(decoded)), set(largest))
+            np.testing.assert_allclose(decoded[largest], self.vector[largest], rtol=1e-6)
+
+    def test_error_feedback_delays_dropped_mass(self):
+        # The update loop of federated._local_update: what a round drops is added to the next one
+        codec = UpdateCodec(top_k=0.05)
+        residual = np.zeros_like(self.vector)
+        sent = np.zeros_like(self.vector)
+        rounds = 200
+        for _ in range(rounds):
+            delta = self.vector + residual
+            decoded = codec.decode(codec.encode(delta))
+            residual = delta - decoded
+            sent += decoded
+        np.testing.assert_allclose(sent + residual, rounds * self.vector)
+        # Every coordinate is eventually sent, so the backlog stays small next to the total
+        self.assertLess(np.abs(residual).max(), np.abs(rounds * self.vector).max() * 0.1)
@@ -0,0 +1,105 @@
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn import svm
+from sklearn.ensemble import VotingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.model_selection import train_test_split
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.tree import DecisionTreeClassifier
+
+from dataset import label_results, load_dataset
+from features import PatientFeatures
+from model_registry import registry
+
+
+def load_training_data():
+    df = load_dataset()
+    df['results'] = label_results(df['Label'])
+    return df
+
+
+def make_prediction_ensemble():
+    """The SVM + SGD voting ensemble served by Predict_Hospital_Morality_Prediction"""
+    return VotingClassifier([
+        ('svm', svm.LinearSVC()),
+        ('SGDClassifier', SGDClassifier(loss='hinge', penalty='l2', random_state=0)),
+    ])
+
+
+def fit_prediction_ensemble(X_train, y_train):
+    classifier = make_prediction_ensemble()
+    classifier.fit(X_train, y_train)
+    return classifier
+
+
+def candidate_models():
+    """Models compared by train_model, in the order they are reported"""
+    return [
+        ("Naive Bayes", MultinomialNB()),
+        ("SVM", svm.LinearSVC()),
+        ("Logistic Regression", LogisticRegression(random_state=0, solver='lbfgs', max_iter=1000)),
+        ("Decision Tree Classifier", DecisionTreeClassifier()),
+        ("SGD Classifier", SGDClassifier(loss='hinge', penalty='l2', random_state=0)),
+    ]
+
+
+class TrainingResult:
+    """Fitted model plus its test-set metrics"""
+    def __init__(self, name, model, accuracy, confusion, report, fit_seconds):
+        self.name = name
+        self.model = model
+        self.accuracy = accuracy
+        self.confusion = confusion
+        self.report = report
+        self.fit_seconds = fit_seconds
+
+    def as_dict(self):
+        return {'name': self.name, 'accuracy': self.accuracy, 'confusion': self.confusion,
+                'report': self.report, 'fit_seconds': self.fit_seconds}
+
+
+def _fit_and_score(name, model, X_train, X_test, y_train, y_test):
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    predicted = model.predict(X_test)
+    return TrainingResult(
+        name, model,
+        accuracy=accuracy_score(y_test, predicted) * 100,
+        confusion=confusion_matrix(y_test, predicted).tolist(),
+        report=classification_report(y_test, predicted, output_dict=True, zero_division=0),
+        fit_seconds=fit_seconds,
+    )
+
+
+def train_candidates(X_train, X_test, y_train, y_test, models=None, n_jobs=None):
+    """Fit every candidate concurrently in a process pool and return their TrainingResults.
+
+    joblib hands the sparse matrices to the workers as read-only memory maps
+    once they pass max_nbytes, so each process shares the same buffers rather
+    than receiving its own pickled copy.
+    """
+    models = models if models is not None else candidate_models()
+    y_train, y_test = np.asarray(y_train), np.asarray(y_test)
+    if n_jobs is None:
+        n_jobs = min(len(models), os.cpu_count() or 1)
+    return Parallel(n_jobs=n_jobs, max_nbytes='1M', mmap_mode='r')(
+        delayed(_fit_and_score)(name, model, X_train, X_test, y_train, y_test) for name, model in models
+    )
+
+
+def train_and_publish():
+    """Train the prediction ensemble from Datasets.csv and publish it to the registry"""
+    df = load_training_data()
+    featurizer = PatientFeatures()
+    X = featurizer.transform(df)
+    X_train, X_test, y_train, y_test = train_test_split(X, df['results'], test_size=0.20)
+    classifier = fit_prediction_ensemble(X_train, y_train)
+    accuracy = classifier.score(X_test, y_test) * 100
+    registry.publish(featurizer, classifier, feature_column=None, accuracy=accuracy,
+                     trained_rows=X_train.shape[0])
+    return registry.get()
@@ -0,0 +1,202 @@
+"""Background runner for the train_model pipeline.
+
+Training is handed to a single worker thread and tracked in the
+``training_jobs`` collection, so the request that starts it returns at once
+and any web worker can report progress by reading the job document. The
+collection is also what keeps web workers from starting a second run while
+one is queued or running anywhere.
+"""
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from sklearn.model_selection import train_test_split
+
+from Remote_User.models import detection_accuracy, training_job
+from dataset import raw_columns
+from features import PatientFeatures
+from incremental import update_incremental
+from model_registry import registry
+from training import candidate_models, load_training_data, make_prediction_ensemble, train_and_publish, train_candidates
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+ENSEMBLE_NAME = "Prediction Ensemble"
+# Seconds between heartbeat_at updates of a running job
+HEARTBEAT_INTERVAL = 30
+# A queued or running job without a heartbeat for this long lost its worker
+STALE_AFTER = 5 * HEARTBEAT_INTERVAL
+# How long a request that needs a model waits for the bootstrap training, and how often it looks
+BOOTSTRAP_TIMEOUT = 600
+BOOTSTRAP_POLL_INTERVAL = 1
+
+# One job at a time: the candidates already fan out over a process pool
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='training')
+_lock = threading.Lock()
+_active_job = None
+
+
+def _progress(job_id, progress, stage, **fields):
+    print("Training job %s: %d%% %s" % (job_id, progress, stage))
+    training_job.objects.update(job_id, progress=progress, stage=stage, heartbeat_at=time.time(), **fields)
+
+
+def _heartbeat(job_id, stopped):
+    # Stages such as fitting the candidates report nothing for minutes
+    while not stopped.wait(HEARTBEAT_INTERVAL):
+        training_job.objects.update(job_id, heartbeat_at=time.time())
+
+
+def _train_full(job_id):
+    """The body of train_model, reporting each stage on the job document"""
+    _progress(job_id, 5, "Loading dataset", status=RUNNING, started_at=time.time())
+    df = load_training_data()
+
+    _progress(job_id, 15, "Vectorizing")
+    featurizer = PatientFeatures()
+    X = featurizer.transform(df)
+    X_train, X_test, y_train, y_test = train_test_split(X, df['results'], test_size=0.20)
+
+    _progress(job_id, 25, "Training models")
+    results = train_candidates(X_train, X_test, y_train, y_test,
+                               models=candidate_models() + [(ENSEMBLE_NAME, make_prediction_ensemble())])
+    for result in results:
+        print("%s: accuracy %.2f (fit %.2fs)" % (result.name, result.accuracy, result.fit_seconds))
+
+    _progress(job_id, 85, "Saving results")
+    accuracies = [{'names': result.name, 'ratio': result.accuracy}
+                  for result in results if result.name != ENSEMBLE_NAME]
+    detection_accuracy.objects.delete_all()
+    detection_accuracy.objects.bulk_create(accuracies)
+    # The date columns as in Datasets.csv: the invalid ones (2022-02-29) were parsed as NaT
+    df.assign(**raw_columns()).to_csv(os.path.join(settings.BASE_DIR, 'Results.csv'), index=False)
+
+    _progress(job_id, 95, "Publishing model")
+    ensemble = results[-1]
+    version = registry.publish(featurizer, ensemble.model, feature_column=None,
+                               accuracy=ensemble.accuracy, trained_rows=X_train.shape[0],
+                               candidates=[result.as_dict() for result in results])
+    print("Published model " + version)
+
+    _progress(job_id, 100, "Finished", status=DONE, finished_at=time.time(), model_version=version,
+              results=accuracies)
+
+
+def _train_incremental(job_id):
+    """partial_fit the checkpointed models on rows appended to Datasets.csv since the last run"""
+    _progress(job_id, 10, "Reading new rows", status=RUNNING, started_at=time.time())
+    report = update_incremental()
+    stage = "Finished: %d new rows, %d in total" % (report['new_rows'], report['total_rows'])
+    _progress(job_id, 100, stage, status=DONE, finished_at=time.time(), model_version=report['version'])
+
+
+def _train_bootstrap(job_id):
+    """Publish a first model for the prediction views, without the candidate comparison of a full run"""
+    _progress(job_id, 10, "Training the prediction ensemble", status=RUNNING, started_at=time.time())
+    version = train_and_publish().version
+    _progress(job_id, 100, "Finished", status=DONE, finished_at=time.time(), model_version=version)
+
+
+MODES = {'full': _train_full, 'incremental': _train_incremental, 'bootstrap': _train_bootstrap}
+
+
+def run_training(job_id, mode='full'):
+    global _active_job
+    stopped = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stopped), daemon=True).start()
+    try:
+        MODES[mode](job_id)
+    except Exception as e:
+        traceback.print_exc()
+        training_job.objects.update(job_id, status=FAILED, stage="Failed", error=str(e), finished_at=time.time())
+    finally:
+        stopped.set()
+        with _lock:
+            if _active_job == job_id:
+                _active_job = None
+
+
+def _live_jobs():
+    """Queued and running jobs of every process, oldest first; those whose worker died are marked failed"""
+    now = time.time()
+    live = []
+    for job in training_job.objects.filter(status__in=[QUEUED, RUNNING]):
+        if now - (job.heartbeat_at or job.created_at or 0) > STALE_AFTER:
+            training_job.objects.update(job.id, status=FAILED, stage="Stale", finished_at=now,
+                                        error="The worker running this job stopped")
+        else:
+            live.append(job)
+    return sorted(live, key=lambda job: (job.created_at or 0, job.id))
+
+
+def submit_training(mode='full'):
+    """Queue a training run ('full' or 'incremental') and return its job id; a run in progress is reused"""
+    global _active_job
+    if mode not in MODES:
+        raise ValueError("Unknown training mode: %s" % mode)
+    with _lock:
+        if _active_job is not None:
+            return _active_job
+        live = _live_jobs()
+        if live:
+            return live[0].id
+        now = time.time()
+        job = training_job.objects.create(status=QUEUED, stage="Queued", progress=0, created_at=now,
+                                          heartbeat_at=now, mode=mode)
+        # Another web worker may have queued a run at the same moment: only the oldest one runs.
+        # Without a database the new job is not read back and simply runs
+        live = _live_jobs()
+        if live and live[0].id != job.id:
+            training_job.objects.update(job.id, status=FAILED, stage="Superseded", finished_at=time.time(),
+                                        error="Another training run was started first")
+            return live[0].id
+        _active_job = job.id
+    _executor.submit(run_training, job.id, mode)
+    return job.id
+
+
+def wait_for_model(timeout=BOOTSTRAP_TIMEOUT):
+    """The published model, training one first if there is none.
+
+    Requests in every web worker that find no model share one training
+    job through submit_training() and wait for it to publish.
+    """
+    deadline = time.monotonic() + timeout
+    job_id = None
+    while True:
+        # Status first: a job is marked done only after its model is published
+        status = job_status(job_id) if job_id else None
+        artifact = registry.get()
+        if artifact is not None:
+            return artifact
+        if status is not None and status['status'] == FAILED:
+            raise RuntimeError("Training a first model failed: %s" % status['error'])
+        if status is None or status['status'] == DONE:
+            # No job yet, or one (perhaps an incremental run) that finished without a model
+            job_id = submit_training('bootstrap')
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out waiting for training job %s to publish a model" % job_id)
+        time.sleep(BOOTSTRAP_POLL_INTERVAL)
+
+
+def job_status(job_id):
+    """The job document as a dict, or None if there is no such job"""
+    try:
+        job = training_job.objects.get(id=job_id)
+    except Exception:
+        return None
+    return vars(training_job(**job.to_dict()))
+
+
+async def ajob_status(job_id):
+    """job_status() for async views"""
+    try:
+        job = await training_job.objects.aget(id=job_id)
+    except Exception:
+        return None
+    return vars(training_job(**job.to_dict()))
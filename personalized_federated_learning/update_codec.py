@@ -0,0 +1,108 @@
+"""Wire formats for federated model updates.
+
+Updates are flat float vectors (the coefficients followed by the intercept)
+and are always deltas against the last global model both sides hold.
+UpdateCodec keeps only the largest top_k entries and quantizes them to int8;
+the sender adds whatever was lost to its next update (error feedback), so
+the dropped mass is delayed rather than discarded.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+# vector size, entries sent, quantization scale, flags
+HEADER = struct.Struct('<IIfB')
+SPARSE = 1
+QUANTIZED = 2
+
+
+class RawCodec:
+    """Uncompressed float64 vectors, the baseline the other codecs are measured against"""
+    name = 'raw'
+
+    def encode(self, vector):
+        return np.ascontiguousarray(vector, dtype=np.float64).tobytes()
+
+    def decode(self, payload):
+        return np.frombuffer(payload, dtype=np.float64).copy()
+
+
+class UpdateCodec:
+    """Top-k sparsification (top_k is a fraction of the vector or a count) and int8 quantization"""
+    def __init__(self, top_k=None, quantize=True):
+        self.top_k = top_k
+        self.quantize = quantize
+
+    @property
+    def name(self):
+        parts = ['top%g' % self.top_k] if self.top_k is not None else []
+        parts.append('int8' if self.quantize else 'float32')
+        return '+'.join(parts)
+
+    def _indices(self, vector):
+        if self.top_k is None:
+            return None
+        count = int(round(self.top_k * len(vector))) if self.top_k < 1 else int(self.top_k)
+        count = max(1, count)
+        if count >= len(vector):
+            return None
+        indices = np.argpartition(np.abs(vector), -count)[-count:]
+        indices.sort()
+        return indices
+
+    def encode(self, vector):
+        vector = np.asarray(vector, dtype=np.float64)
+        indices = self._indices(vector)
+        values = vector if indices is None else vector[indices]
+        flags = 0
+        parts = []
+        if indices is not None:
+            flags |= SPARSE
+            # Sorted positions are stored as gaps, which deflate to a fraction of their size
+            gaps = zlib.compress(np.diff(indices, prepend=0).astype(np.uint32).tobytes(), 1)
+            parts += [struct.pack('<I', len(gaps)), gaps]
+        if self.quantize:
+            flags |= QUANTIZED
+            peak = float(np.abs(values).max()) if len(values) else 0.0
+            scale = peak / 127 if peak else 1.0
+            parts.append(np.round(values / scale).astype(np.int8).tobytes())
+        else:
+            scale = 1.0
+            parts.append(values.astype(np.float32).tobytes())
+        return HEADER.pack(len(vector), len(values), scale, flags) + b''.join(parts)
+
+    def decode(self, payload):
+        size, count, scale, flags = HEADER.unpack_from(payload)
+        offset = HEADER.size
+        indices = None
+        if flags & SPARSE:
+            (length,) = struct.unpack_from('<I', payload, offset)
+            offset += 4
+            gaps = np.frombuffer(zlib.decompress(payload[offset:offset + length]), dtype=np.uint32)
+            indices = np.cumsum(gaps, dtype=np.int64)
+            offset += length
+        if flags & QUANTIZED:
+            values = np.frombuffer(payload, dtype=np.int8, count=count, offset=offset) * np.float64(scale)
+        else:
+            values = np.frombuffer(payload, dtype=np.float32, count=count, offset=offset).astype(np.float64)
+        if indices is None:
+            return values
+        vector = np.zeros(size)
+        vector[indices] = values
+        return vector
+
+
+def codec_from_spec(spec):
+    """'raw', 'int8', 'float32', 'top0.01', 'top0.01+int8', ... as used by the management commands"""
+    top_k, quantize = None, False
+    for part in spec.split('+'):
+        if part == 'raw':
+            return RawCodec()
+        if part == 'int8':
+            quantize = True
+        elif part.startswith('top'):
+            top_k = float(part[3:])
+        elif part != 'float32':
+            raise ValueError("Unknown codec: %s" % spec)
+    return UpdateCodec(top_k=top_k, quantize=quantize)